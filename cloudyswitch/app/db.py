@@ -14,9 +14,16 @@
 # implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import functools
 import logging
+import weakref
 import psyco_eventlet
-from ryu.exception import RyuException
+from ryu.lib import hub
+from host_table import HostTable
+from db_pool import ConnectionPool
+import schema
+from storage import Backend
+from storage import ArpTableNotFoundException, GroupAlreadyExistException
 
 psyco_eventlet.make_psycopg_green()
 
@@ -24,203 +31,404 @@ import psycopg2
 
 LOG = logging.getLogger("db")
 #TODO Required to configure for db connecting.
-conn = psycopg2.connect("dbname=ryu user=postgres")
+DSN = "dbname=ryu user=postgres"
+POOL_SIZE = 8
 #ISOLATION_LEVE_READ_COMMITTED is default setting.
 #conn.set_isolation_level(ISOLATION_LEVEL_READ_COMMITTED)
+pool = ConnectionPool(DSN, POOL_SIZE)
+#greenthread => connection checked out for its running transaction
+_bound = {}
+#greenthread => number of statements it has sent to the db
+_statements = weakref.WeakKeyDictionary()
 
-class ArpTableNotFoundException(RyuException):
-    message = '%(msg)s'
+#Authoritative host table, arp_table is written behind it.
+hosts = HostTable()
+_host_queue = hub.Queue()
+_host_writer = []
 
-class GroupAlreadyExistException(RyuException):
-    message = '%(msg)s'
+def transactional(func):
+    """Run func in one transaction on a connection checked out of pool.
 
+    The transaction is committed when func returns and rolled back when
+    it raises. Nested calls share the outer transaction. If the
+    connection turns out to be broken before the commit is sent, it is
+    replaced and func is retried once. A failed commit is raised, the
+    server may have committed it and func is not idempotent.
+    """
+    @functools.wraps(func)
+    def _wrapper(*args, **kwargs):
+        current = hub.getcurrent()
+        if current in _bound:
+            return func(*args, **kwargs)
+        retry = True
+        while True:
+            pconn = pool.get()
+            _bound[current] = pconn
+            try:
+                result = func(*args, **kwargs)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                del _bound[current]
+                pool.put(pconn, discard=True)
+                if not retry:
+                    raise
+                LOG.info('Retry %s on a new db connection', func.__name__)
+                retry = False
+                continue
+            except:
+                del _bound[current]
+                _rollback(pconn)
+                raise
+            del _bound[current]
+            try:
+                pconn.conn.commit()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                pool.put(pconn, discard=True)
+                raise
+            except:
+                _rollback(pconn)
+                raise
+            pool.put(pconn)
+            return result
+    return _wrapper
+
+def _rollback(pconn):
+    try:
+        pconn.conn.rollback()
+    except psycopg2.Error:
+        pool.put(pconn, discard=True)
+    else:
+        pool.put(pconn)
+
+def _cursor():
+    _count_statement()
+    return _bound[hub.getcurrent()].cursor()
+
+def _count_statement():
+    current = hub.getcurrent()
+    _statements[current] = _statements.get(current, 0) + 1
+
+def statement_count():
+    """Return the number of statements sent by the current greenthread."""
+    return _statements.get(hub.getcurrent(), 0)
+
+@transactional
 def fetch(query):
-    cur = conn.cursor()
+    cur = _cursor()
     cur.execute(query)
     return cur.fetchall()
 
+@transactional
 def execute(cmd):
-    curs = conn.cursor()
+    curs = _cursor()
     curs.execute(cmd)
 
 def commit():
-    conn.commit()
-
-def create_table(table_name, curs):
-    if table_name == 'arp_table':
-        curs.execute('CREATE TABLE arp_table (dpid integer, \
-                     port_no integer, mac_addr varchar, ip_addr varchar)')
-    elif table_name == 'path_table':
-        curs.execute('CREATE TABLE path_table (path_id serial primary key, \
-                      src_dpid integer, src_port_no integer, dst_dpid integer, \
-                      dst_port_no integer, cost smallint)')
-    elif table_name == 'path_desc_table':
-        curs.execute('CREATE TABLE path_desc_table (path_id int REFERENCES \
-                      path_table(path_id), path_seq integer, dpid integer, \
-                      port_no integer)')
-    elif table_name == 'label_table':
-        curs.execute('CREATE TABLE label_table (path_id integer REFERENCES \
-                      path_table(path_id), src_dpid integer, src_port_no integer, \
-                      dst_dpid integer, dst_port_no integer, label serial, \
-                      prev_label integer, target_dst_dpid integer)')
-    elif table_name == 'group_table':
-        curs.execute('CREATE TABLE group_table (group_id serial primary key, \
-                      dpid integer, including_path varchar)')
-
-def exist_table(table_name):
-    curs = conn.cursor()
-    curs.execute('SELECT * FROM information_schema.tables WHERE table_name=%s',
-                 (table_name,))
-    if not bool(curs.rowcount):
-        create_table(table_name, curs)
+    """Commit is done at the end of the outermost transactional call."""
+    pass
+
+#name => (parameter types, query) of the statements prepared on demand
+STATEMENTS = {
+    'insert_host': ('integer, integer, varchar, varchar',
+                    'INSERT INTO arp_table (dpid, port_no, mac_addr, ip_addr)\
+                     VALUES ($1, $2, $3, $4)'),
+    'fetch_path_id': ('integer, integer, integer, integer',
+                      'SELECT path_id FROM path_table WHERE src_dpid = $1 AND\
+                       src_port_no = $2 AND dst_dpid = $3 AND\
+                       dst_port_no = $4'),
+    'insert_paths': ('integer, integer, integer, integer, smallint[]',
+                     'INSERT INTO path_table (src_dpid, src_port_no,\
+                      dst_dpid, dst_port_no, cost) SELECT $1, $2, $3, $4, cost\
+                      FROM unnest($5) AS cost RETURNING path_id'),
+    'insert_path_descs': ('integer[], integer[], integer[], integer[]',
+                          'INSERT INTO path_desc_table (path_id, path_seq,\
+                           dpid, port_no)\
+                           SELECT * FROM unnest($1, $2, $3, $4)'),
+    'fetch_paths_desc': ('integer[]',
+                         'SELECT d.path_id, d.dpid, d.port_no, p.dst_dpid\
+                          FROM path_desc_table d JOIN path_table p\
+                          ON d.path_id = p.path_id WHERE d.path_id = ANY($1)\
+                          ORDER BY d.path_id, d.path_seq'),
+    'reserve_labels': ('integer',
+                       'SELECT nextval(\'label_table_label_seq\')\
+                        FROM generate_series(1, $1)'),
+    'insert_labels': ('integer[], integer[], integer[], integer[], integer[],\
+                       integer[], integer[], integer[]',
+                      'INSERT INTO label_table (path_id, src_dpid,\
+                       src_port_no, dst_dpid, dst_port_no, label, prev_label,\
+                       target_dst_dpid)\
+                       SELECT * FROM unnest($1, $2, $3, $4, $5, $6, $7, $8)'),
+    'fetch_path_labels': ('integer',
+                          'SELECT * FROM label_table WHERE path_id = $1\
+                           ORDER BY label'),
+    'fetch_grouping_labels': ('integer[]',
+                              'SELECT * FROM label_table WHERE\
+                               prev_label = -1 AND path_id = ANY($1)\
+                               ORDER BY label'),
+    'count_group': ('varchar',
+                    'SELECT COUNT(*) FROM group_table WHERE\
+                     including_path = $1'),
+    'insert_group': ('integer, varchar',
+                     'INSERT INTO group_table (dpid, including_path)\
+                      VALUES ($1, $2) RETURNING group_id'),
+    'fetch_single_labels': ('integer[], integer[]',
+                            'SELECT * FROM label_table WHERE\
+                             path_id = ANY($1) AND label <> ALL($2)\
+                             ORDER BY label'),
+    'insert_group_paths': ('integer, integer[]',
+                           'INSERT INTO group_path_table (group_id, path_id)\
+                            SELECT $1, unnest($2)'),
+    'fetch_port_paths': ('integer, integer',
+                         'SELECT path_id FROM path_desc_table WHERE\
+                          dpid = $1 AND port_no = $2'),
+    'fetch_path_group_ids': ('integer[]',
+                             'SELECT DISTINCT m.group_id, g.dpid FROM\
+                              group_path_table m JOIN group_table g\
+                              ON m.group_id = g.group_id\
+                              WHERE m.path_id = ANY($1) ORDER BY m.group_id'),
+    'delete_paths_labels': ('integer[]',
+                            'DELETE FROM label_table WHERE path_id = ANY($1)'),
+    'delete_group_paths': ('integer[]',
+                           'DELETE FROM group_path_table\
+                            WHERE path_id = ANY($1)'),
+    'update_groups_paths': ('integer[]',
+                            'UPDATE group_table g SET including_path =\
+                             coalesce((SELECT string_agg(m.path_id::text,\
+                             \',\' ORDER BY m.path_id) FROM group_path_table m\
+                             WHERE m.group_id = g.group_id), \'\')\
+                             WHERE g.group_id = ANY($1)'),
+    'fetch_groups_grouping_labels': ('integer[]',
+                                     'SELECT m.group_id, l.* FROM\
+                                      group_path_table m JOIN label_table l\
+                                      ON m.path_id = l.path_id WHERE\
+                                      l.prev_label = -1 AND\
+                                      m.group_id = ANY($1)\
+                                      ORDER BY m.group_id, l.label'),
+    'fetch_hosts': ('', 'SELECT * FROM arp_table'),
+    'fetch_all_paths': ('', 'SELECT * FROM path_table ORDER BY path_id'),
+    'fetch_all_paths_desc': ('', 'SELECT path_id, dpid, port_no FROM\
+                                  path_desc_table\
+                                  ORDER BY path_id, path_seq'),
+    'fetch_all_labels': ('', 'SELECT * FROM label_table\
+                              ORDER BY path_id, label'),
+    'fetch_all_groups': ('', 'SELECT group_id, dpid FROM group_table\
+                              ORDER BY group_id'),
+    'fetch_all_group_paths': ('', 'SELECT group_id, path_id FROM\
+                                   group_path_table\
+                                   ORDER BY group_id, path_id'),
+    'journal_path': ('integer, integer, integer, integer, integer, smallint',
+                     'INSERT INTO path_table (path_id, src_dpid, src_port_no,\
+                      dst_dpid, dst_port_no, cost)\
+                      VALUES ($1, $2, $3, $4, $5, $6)'),
+    'journal_group': ('integer, integer, varchar',
+                      'INSERT INTO group_table (group_id, dpid,\
+                       including_path) VALUES ($1, $2, $3)'),
+    'sync_sequences': ('', 'SELECT setval(\'path_table_path_id_seq\',\
+                            (SELECT max(path_id) FROM path_table)),\
+                            setval(\'label_table_label_seq\',\
+                            (SELECT max(label) FROM label_table)),\
+                            setval(\'group_table_group_id_seq\',\
+                            (SELECT max(group_id) FROM group_table))'),
+    'fetch_groups': ('', 'SELECT group_id, dpid FROM group_table\
+                          ORDER BY group_id'),
+    'fetch_groups_single_labels': ('integer[]',
+                                   'SELECT m.group_id, l.* FROM\
+                                    group_path_table m JOIN label_table l\
+                                    ON m.path_id = l.path_id WHERE\
+                                    l.prev_label <> -1 AND\
+                                    m.group_id = ANY($1)\
+                                    ORDER BY m.group_id, l.label'),
+    'fetch_switch_groups': ('integer',
+                            'SELECT DISTINCT ON (g.group_id) g.group_id,\
+                             a.dpid, a.port_no, a.mac_addr, a.ip_addr FROM\
+                             group_table g JOIN group_path_table m\
+                             ON g.group_id = m.group_id JOIN path_table p\
+                             ON m.path_id = p.path_id JOIN arp_table a\
+                             ON p.dst_dpid = a.dpid AND\
+                             p.dst_port_no = a.port_no\
+                             WHERE g.dpid = $1 ORDER BY g.group_id'),
+    'fetch_switch_hosts': ('integer',
+                           'SELECT * FROM arp_table WHERE dpid = $1'),
+    'fetch_switch_swap_labels': ('integer',
+                                 'SELECT * FROM label_table WHERE\
+                                  src_dpid = $1 AND prev_label <> -1\
+                                  ORDER BY label'),
+    'fetch_switch_last_labels': ('integer',
+                                 'SELECT l.label FROM label_table l WHERE\
+                                  l.target_dst_dpid = $1 AND NOT EXISTS\
+                                  (SELECT 1 FROM label_table n\
+                                   WHERE n.prev_label = l.label)\
+                                  ORDER BY l.label'),
+}
+
+def _prepare(pconn, name):
+    if name not in pconn.prepared:
+        types, query = STATEMENTS[name]
+        if types:
+            types = '(%s)' % types
+        _count_statement()
+        pconn.cursor().execute('PREPARE %s %s AS %s' % (name, types, query))
+        pconn.prepared.add(name)
+
+def _execute_prepared(name, params):
+    pconn = _bound[hub.getcurrent()]
+    _prepare(pconn, name)
+    _count_statement()
+    curs = pconn.cursor()
+    if params:
+        curs.execute('EXECUTE %s (%s)' % (name, ', '.join(['%s'] * len(params))),
+                     params)
+    else:
+        curs.execute('EXECUTE %s' % name)
+    return curs
+
+@transactional
+def fetch_prepared(name, *params):
+    """Run the prepared statement name with bound params, return rows."""
+    return _execute_prepared(name, params).fetchall()
 
+@transactional
+def execute_prepared(name, *params):
+    """Run the prepared statement name with bound params."""
+    _execute_prepared(name, params)
+
+@transactional
+def migrate():
+    """Create the tables and apply pending schema migrations."""
+    return schema.migrate(_cursor())
+
+@transactional
 def clean_tables():
-    curs = conn.cursor()
-    exist_table('arp_table')
-    exist_table('path_table')
-    exist_table('path_desc_table')
-    exist_table('label_table')
-    exist_table('group_table')
+    migrate()
+    curs = _cursor()
     curs.execute('DELETE FROM arp_table')
+    curs.execute('DELETE FROM group_path_table')
     curs.execute('DELETE FROM path_desc_table')
     curs.execute('DELETE FROM label_table')
     curs.execute('DELETE FROM path_table')
     curs.execute('DELETE FROM group_table')
-    commit()
+    while not _host_queue.empty():
+        _host_queue.get_nowait()
+    hosts.clear()
+
+@transactional
+def _insert_host(entry):
+    execute_prepared('insert_host', *entry)
+
+def _write_hosts():
+    while True:
+        entry = _host_queue.get()
+        try:
+            _insert_host(entry)
+        except psycopg2.Error:
+            LOG.exception('Failed to persist host %s', entry)
+
+def _persist_host(entry):
+    if not _host_writer:
+        _host_writer.append(hub.spawn(_write_hosts))
+    _host_queue.put(entry)
 
 def handle_arp_packet(arppkt, dpid, port_no):
+    src_port, is_new = hosts.learn(dpid, port_no,
+                                   arppkt.src_mac, arppkt.src_ip)
+    if is_new:
+        _persist_host(src_port)
     #Fetch from dst_ip
-    src_port = fetch('SELECT * FROM arp_table WHERE mac_addr = \'%s\''\
-                        % (arppkt.src_mac))
-    if not len(src_port):
-        src_port = (dpid, port_no, arppkt.src_mac, arppkt.src_ip)
-        execute('INSERT INTO arp_table (dpid, port_no, mac_addr,\
-                 ip_addr) VALUES (%d, %d, \'%s\', \'%s\')'\
-                 % src_port)
-        commit()
-        src_port = [src_port]
-            
-    dst_port = fetch('SELECT * FROM arp_table WHERE ip_addr = \'%s\''\
-                     % (arppkt.dst_ip))
-    if len(dst_port):
-        return src_port[0], dst_port[0]
+    dst_port = hosts.get_by_ip(arppkt.dst_ip)
+    if dst_port is not None:
+        return src_port, dst_port
     else:
         raise ArpTableNotFoundException(
               msg='NotFound dst_port in arptable')
 
 def fetch_path_id(src_port, dst_port):
-    paths = fetch('SELECT path_id FROM path_table WHERE src_dpid = %d AND\
-                  src_port_no = %d AND dst_dpid = %d AND\
-                  dst_port_no = %d' % (src_port[0], src_port[1],
-                  dst_port[0], dst_port[1]))
+    paths = fetch_prepared('fetch_path_id', src_port[0], src_port[1],
+                           dst_port[0], dst_port[1])
     return paths 
 
-def register_path(path, src_port, dst_port):
-    execute('INSERT INTO path_table (src_dpid, src_port_no, \
-             dst_dpid, dst_port_no, cost)\
-             VALUES (%d, %d, %d, %d, %d)' %
-             (src_port[0], src_port[1],
-              dst_port[0], dst_port[1], len(path)))
-    path_id = fetch('SELECT currval(\'path_table_path_id_seq\')')
-    path_seq = 0
-    for port in path:
-        execute('INSERT INTO path_desc_table (path_id, path_seq,\
-                 dpid, port_no)\
-                 VALUES (%d, %d, %d, %d)' % 
-                 (path_id[0][0], path_seq, port.dpid, port.port_no))
-        path_seq += 1
-    return path_id[0]
+def register_paths(path_list, src_port, dst_port):
+    """Register every path between src_port and dst_port at once."""
+    costs = [len(path) for path in path_list]
+    path_ids = fetch_prepared('insert_paths', src_port[0], src_port[1],
+                              dst_port[0], dst_port[1], costs)
+    #Serial values are assigned in the order of inserted rows.
+    path_ids.sort()
+    desc_path_ids = []
+    desc_seqs = []
+    desc_dpids = []
+    desc_port_nos = []
+    for path_id, path in zip(path_ids, path_list):
+        path_seq = 0
+        for port in path:
+            desc_path_ids.append(path_id[0])
+            desc_seqs.append(path_seq)
+            desc_dpids.append(port.dpid)
+            desc_port_nos.append(port.port_no)
+            path_seq += 1
+    execute_prepared('insert_path_descs', desc_path_ids, desc_seqs,
+                     desc_dpids, desc_port_nos)
+    return path_ids
 
+@transactional
 def handle_paths(path_list, src_port, dst_port, is_detect_exists=False):
     #Confirm paths that already exists
     path_ids = fetch_path_id(src_port, dst_port)
-    if not len(path_ids):
-        for path in path_list:
-            path_id = register_path(path, src_port, dst_port)
-            path_ids.append(path_id)
-        commit()
+    if not len(path_ids) and len(path_list):
+        path_ids = register_paths(path_list, src_port, dst_port)
     return path_ids
 
-def register_label(path_id, src_port, dst_port, prev_label, target_dst_dpid):
-    registered_label = fetch('SELECT * FROM label_table WHERE\
-                              src_dpid = %d AND src_port_no = %d AND\
-                              dst_dpid = %d AND dst_port_no = %d AND\
-                              target_dst_dpid = %d AND prev_label = %d' % 
-                              (src_port[2], src_port[3], dst_port[2], dst_port[3],
-                               target_dst_dpid, prev_label))
-    #if not len(registered_label):
-    execute('INSERT INTO label_table (path_id, src_dpid, src_port_no, \
-                 dst_dpid, dst_port_no, prev_label, target_dst_dpid)\
-                 VALUES (%d, %d, %d, %d, %d, %d, %d)' %
-                 (path_id, src_port[2], src_port[3],
-                  dst_port[2], dst_port[3], prev_label, target_dst_dpid))
-    label = fetch('SELECT currval(\'label_table_label_seq\')')
-    registered_label = (path_id, src_port[2], src_port[3], dst_port[2],
-                            dst_port[3], label[0][0], prev_label, target_dst_dpid)
-    #else:
-    #    registered_label = registered_label[0]
-        #common path found
-    #    if registered_label[6] != -1 and prev_label != -1:
-    #        execute('UPDATE label_table SET label = %d WHERE label = %d AND\
-    #                 path_id = %d' %
-    #                 (registered_label[6], prev_label, path_id))
-    return registered_label
-        
+def register_labels(path_ids):
+    """Register a label for every hop of the paths at once.
+
+    Return dict of path_id => the label of the last hop.
+    """
+    path_desc = {}
+    for desc in fetch_prepared('fetch_paths_desc', list(path_ids)):
+        path_desc.setdefault(desc[0], []).append(desc)
+    label_num = sum(len(path_desc.get(path_id, [])) // 2
+                    for path_id in path_ids)
+    labels = iter(sorted(label[0] for label in
+                         fetch_prepared('reserve_labels', label_num)))
+    columns = ([], [], [], [], [], [], [], [])
+    last_labels = {}
+    for path_id in path_ids:
+        prev_label = -1
+        for src_port, dst_port in create_port_set(path_desc.get(path_id, [])):
+            label = next(labels)
+            entry = (path_id, src_port[1], src_port[2], dst_port[1],
+                     dst_port[2], label, prev_label, src_port[3])
+            for column, value in zip(columns, entry):
+                column.append(value)
+            prev_label = label
+        last_labels[path_id] = prev_label
+    execute_prepared('insert_labels', *columns)
+    return last_labels
+
 def create_port_set(path_ports, num = 2):
   if not path_ports:
       return []
   return [path_ports[:num]] + create_port_set(path_ports[num:], num)
     
+@transactional
 def fetch_label_flows(path_id):
-    path = fetch('SELECT * FROM path_table WHERE\
-                  path_id = %d' % (path_id))
-    path_desc = fetch('SELECT * FROM path_desc_table WHERE\
-                       path_id = %d ORDER BY path_seq' %
-                       (path_id))
-    prev_label = -1
-    registered_label = []
-    for port_set in create_port_set(path_desc):
-        src_port = port_set[0]
-        dst_port = port_set[1]
-        label_entry = register_label(path_id, src_port,
-                                     dst_port, prev_label, path[0][3])
-        registered_label.append(label_entry)
-        prev_label = label_entry[5]
-    commit()
-    label_flows = fetch('SELECT * FROM label_table WHERE\
-                        path_id = %d' % (path_id))
-    if not len(label_flows):
-        #Already registered labels, but first entry required.
-        label_flows.append(registered_label[0])
-        prev_label = -1
+    prev_label = register_labels([path_id])[path_id]
+    label_flows = fetch_prepared('fetch_path_labels', path_id)
     return label_flows, prev_label
 
-def fetch_group_flows(paths):
-    last_labels = []
-    path_ids = []
-    for path_id in paths:
-        ignore, last_label = fetch_label_flows(path_id)
-        last_labels.append(last_label)
-        path_ids.append(path_id)
-    try:
-        path_ids = ','.join(str(i) for i in path_ids)
-    except TypeError:
-        path_ids = str(path_ids[0])
-    grouping_label  = fetch('SELECT * FROM label_table WHERE\
-                             prev_label = -1 and path_id IN (%s)' %
-                             (path_ids,))
-    group_is_exist = fetch('SELECT COUNT(*) FROM group_table WHERE\
-                            including_path = \'%s\'' % (path_ids))
-    if group_is_exist[0][0] == 1:
+@transactional
+def fetch_group_flows(paths, failover=None):
+    path_list = list(paths)
+    path_ids = ','.join(str(i) for i in path_list)
+    group_is_exist = fetch_prepared('count_group', path_ids)
+    if group_is_exist[0][0]:
             raise GroupAlreadyExistException(
               msg='Group entry is alread exsit.')
+    last_label_dict = register_labels(path_list)
+    last_labels = [last_label_dict[path_id] for path_id in path_list]
+    grouping_label = fetch_prepared('fetch_grouping_labels', path_list)
     #All labels are owns same dpid.
     dpid = grouping_label[0][1]
-    execute('INSERT INTO group_table (dpid, including_path) VALUES \
-             (%d, \'%s\')' %
-             (dpid, path_ids,))
-
-    group_id = fetch('SELECT currval(\'group_table_group_id_seq\')')
+    group_id = fetch_prepared('insert_group', dpid, path_ids)
+    execute_prepared('insert_group_paths', group_id[0][0], path_list)
     group_flow = {}
     group = {}
     group['group_id'] = group_id[0][0]
@@ -234,54 +442,138 @@ def fetch_group_flows(paths):
         grouped_label.append(label[5])
         buckets.append(watch)
     group['buckets'] = buckets
-    try:
-        grouped_label = ','.join(str(i) for i in grouped_label)
-    except TypeError:
-        grouped_label = str(path_ids[0])
-    single_labels = fetch('SELECT * FROM label_table WHERE path_id IN (%s) AND \
-                           label NOT IN (%s)' % (path_ids, grouped_label,))
+    single_labels = fetch_prepared('fetch_single_labels',
+                                   path_list, grouped_label)
+    if failover is not None:
+        failover.add_group(group['group_id'], dpid,
+                           grouping_label, single_labels)
     group_flow['group_flow'] = group
     group_flow['label_flow'] = single_labels
     group_flow['last_label'] = last_labels
     return group_flow
 
+@transactional
 def detect_require_modify_paths(dpid, port_no):
-    unavailable_paths = fetch('SELECT path_id FROM path_desc_table WHERE dpid = %s AND \
-                               port_no = %s' % (dpid, port_no))
-    group_id_dict = {}
-    for path in unavailable_paths:
-        group_ids = fetch('SELECT group_id, dpid, including_path FROM group_table WHERE \
-                            including_path LIKE \'%%%s%%\'' % (path[0],))
-        for group in group_ids:
-            group_id_dict[group[0]] = group[2]
-        execute('DELETE FROM label_table WHERE path_id = %s' % (path[0],))
+    unavailable_paths = [path[0] for path in
+                         fetch_prepared('fetch_port_paths', dpid, port_no)]
+    groups = fetch_prepared('fetch_path_group_ids', unavailable_paths)
+    group_ids = [group[0] for group in groups]
+    execute_prepared('delete_paths_labels', unavailable_paths)
+    execute_prepared('delete_group_paths', unavailable_paths)
+    execute_prepared('update_groups_paths', group_ids)
+    group_buckets = dict((group_id, []) for group_id in group_ids)
+    for label in fetch_prepared('fetch_groups_grouping_labels', group_ids):
+        watch = {}
+        watch['watch'] = (label[3])
+        watch['label'] = (label[3], label[6], label[7])
+        group_buckets[label[0]].append(watch)
     group_flows = []
-    for group_id, paths in group_id_dict.items():
-        path_list = paths.split(',')
-        new_path_list = []
-        for path in path_list:
-            if path not in unavailable_paths[0]:
-                new_path_list.append(path)
-        try:
-            new_path_ids = ','.join(str(i) for i in new_path_list)
-        except TypeError:
-            new_path_ids = str(new_path_list[0])
-        execute('UPDATE group_table SET including_path = \'%s\' WHERE group_id = %d'%
-                (new_path_ids, group_id))
-        grouping_label  = fetch('SELECT * FROM label_table WHERE\
-                                 prev_label = -1 and path_id IN (%s)' %
-                                 (new_path_ids,))
-        buckets = []
+    for group_id, dpid in groups:
         group = {}
-        for label in grouping_label:
-            watch = {}
-            watch['watch'] = (label[2])
-            watch['label'] = (label[2], label[5], label[6])
-            buckets.append(watch)
-            dpid = label[1]
         group['group_id'] = group_id
         group['dpid'] = dpid
-        group['buckets'] = buckets
+        group['buckets'] = group_buckets[group_id]
         group_flows.append(group)
-    commit()
     return group_flows
+
+@transactional
+def write_journal(entries):
+    """Run the (statement name, params) entries in one transaction.
+
+    The entries insert rows with the ids they were given in memory, so
+    the serials are moved past them for the other backends.
+    """
+    for name, params in entries:
+        execute_prepared(name, *params)
+    fetch_prepared('sync_sequences')
+
+@transactional
+def fetch_tables():
+    """Return every row of the tables, by table name."""
+    migrate()
+    tables = {}
+    for table in ('hosts', 'all_paths', 'all_paths_desc', 'all_labels',
+                  'all_groups', 'all_group_paths'):
+        tables[table] = fetch_prepared('fetch_%s' % table)
+    return tables
+
+@transactional
+def restore(failover):
+    """Load the hosts and index the groups of the tables."""
+    migrate()
+    hosts.clear()
+    for host in fetch_prepared('fetch_hosts'):
+        hosts.add(host)
+    groups = fetch_prepared('fetch_groups')
+    group_ids = [group[0] for group in groups]
+    grouping_labels = {}
+    for label in fetch_prepared('fetch_groups_grouping_labels', group_ids):
+        grouping_labels.setdefault(label[0], []).append(label[1:])
+    single_labels = {}
+    for label in fetch_prepared('fetch_groups_single_labels', group_ids):
+        single_labels.setdefault(label[0], []).append(label[1:])
+    for group_id, dpid in groups:
+        failover.add_group(group_id, dpid, grouping_labels.get(group_id, []),
+                           single_labels.get(group_id, []))
+
+@transactional
+def fetch_switch_state(dpid):
+    groups = fetch_prepared('fetch_switch_groups', dpid)
+    group_buckets = dict((group[0], []) for group in groups)
+    for label in fetch_prepared('fetch_groups_grouping_labels',
+                                list(group_buckets)):
+        watch = {}
+        watch['watch'] = (label[3])
+        watch['label'] = (label[3], label[6], label[7])
+        group_buckets[label[0]].append(watch)
+    state = {}
+    state['hosts'] = fetch_prepared('fetch_switch_hosts', dpid)
+    state['groups'] = []
+    for group in groups:
+        if not group_buckets[group[0]]:
+            continue
+        group_flow = {}
+        group_flow['group_id'] = group[0]
+        group_flow['dpid'] = dpid
+        group_flow['buckets'] = group_buckets[group[0]]
+        state['groups'].append((group_flow, group[1:]))
+    state['label_flows'] = fetch_prepared('fetch_switch_swap_labels', dpid)
+    state['last_labels'] = [label[0] for label in
+                            fetch_prepared('fetch_switch_last_labels', dpid)]
+    return state
+
+class PostgresBackend(Backend):
+    """Backend on the Postgres tables of this module."""
+
+    def clean_tables(self):
+        clean_tables()
+        self.failover.clear()
+
+    def restore(self):
+        self.failover.clear()
+        restore(self.failover)
+
+    def handle_arp_packet(self, arppkt, dpid, port_no):
+        return handle_arp_packet(arppkt, dpid, port_no)
+
+    def handle_paths(self, path_list, src_port, dst_port):
+        return handle_paths(path_list, src_port, dst_port)
+
+    def fetch_label_flows(self, path_id):
+        return fetch_label_flows(path_id)
+
+    def fetch_group_flows(self, paths):
+        return fetch_group_flows(paths, self.failover)
+
+    def detect_require_modify_paths(self, dpid, port_no):
+        return detect_require_modify_paths(dpid, port_no)
+
+    @transactional
+    def detect_require_modify_ports(self, ports):
+        return Backend.detect_require_modify_ports(self, ports)
+
+    def fetch_switch_state(self, dpid):
+        return fetch_switch_state(dpid)
+
+    def statement_count(self):
+        return statement_count()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 cloudysunny14.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import time
+from eventlet.queue import LifoQueue
+
+import psycopg2
+
+LOG = logging.getLogger(__name__)
+
+class PooledConnection(object):
+    def __init__(self, conn):
+        self.conn = conn
+        self.last_used = time.time()
+        #names of server-side prepared statements on this connection
+        self.prepared = set()
+
+    def cursor(self):
+        return self.conn.cursor()
+
+    def close(self):
+        try:
+            self.conn.close()
+        except psycopg2.Error:
+            pass
+
+class ConnectionPool(object):
+    """Bounded pool of green psycopg2 connections.
+
+    Connections are opened lazily on checkout. A connection which was
+    idle longer than HEALTH_CHECK_INTERVAL is pinged before it is handed
+    out, and a broken one is replaced with a new connection.
+    """
+
+    HEALTH_CHECK_INTERVAL = 30.
+
+    def __init__(self, dsn, size):
+        self.dsn = dsn
+        self.size = size
+        #None is a free slot which has no connection yet. The most
+        #recently used connection is handed out first.
+        self.idle = LifoQueue(size)
+        for i in range(size):
+            self.idle.put(None)
+
+    def _connect(self):
+        LOG.debug('Open db connection %s', self.dsn)
+        return PooledConnection(psycopg2.connect(self.dsn))
+
+    def _is_healthy(self, pconn):
+        if pconn.conn.closed:
+            return False
+        if time.time() - pconn.last_used < self.HEALTH_CHECK_INTERVAL:
+            return True
+        try:
+            curs = pconn.cursor()
+            curs.execute('SELECT 1')
+            pconn.conn.rollback()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+        return True
+
+    def get(self):
+        """Check out a connection, blocks while the pool is exhausted."""
+        pconn = self.idle.get()
+        try:
+            if pconn is not None and not self._is_healthy(pconn):
+                LOG.info('Reconnect broken db connection')
+                pconn.close()
+                pconn = None
+            if pconn is None:
+                pconn = self._connect()
+        except:
+            self.idle.put(None)
+            raise
+        return pconn
+
+    def put(self, pconn, discard=False):
+        """Check in a connection, a discarded one frees its slot."""
+        if discard or pconn.conn.closed:
+            pconn.close()
+            pconn = None
+        else:
+            pconn.last_used = time.time()
+        self.idle.put(pconn)
+
+    def close(self):
+        for i in range(self.size):
+            pconn = self.idle.get()
+            if pconn is not None:
+                pconn.close()
+        for i in range(self.size):
+            self.idle.put(None)
@@ -129,6 +129,8 @@ class EventLinkReply(event.EventReplyBase):
 
 #Added EventArpReceived
 class EventArpReceived(event.EventBase):
-    def __init__(self, ev):
+    def __init__(self, ev, arp=None):
         super(EventArpReceived, self).__init__()
         self.ev = ev
+        # decoded arp of ev.msg.data
+        self.arp = arp
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 cloudysunny14.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+
+LOG = logging.getLogger(__name__)
+
+class FailoverIndex(object):
+    """Index from a port to the fast failover groups of the paths over it.
+
+    Filled by the storage backends whenever a group is registered, so the
+    group mods for a dead port are known without asking the storage.
+    Labels have the row layout of storage.Backend.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.groups = {}        # group_id => (dpid, [path_id])
+        self.buckets = {}       # path_id => bucket of its first hop
+        self.port_paths = {}    # (dpid, port_no) => set(path_id)
+        self.path_ports = {}    # path_id => set((dpid, port_no))
+        self.path_groups = {}   # path_id => set(group_id)
+
+    def __len__(self):
+        return len(self.groups)
+
+    def add_group(self, group_id, dpid, grouping_labels, labels):
+        """Index a group.
+
+        grouping_labels are the first hop labels of the paths in bucket
+        order, labels the rest of the labels of the paths.
+        """
+        path_ids = []
+        for label in grouping_labels:
+            path_id = label[0]
+            path_ids.append(path_id)
+            self.buckets[path_id] = {'watch': label[2],
+                                     'label': (label[2], label[5], label[6])}
+            self.path_groups.setdefault(path_id, set()).add(group_id)
+        self.groups[group_id] = (dpid, path_ids)
+        for label in list(grouping_labels) + list(labels):
+            for port in ((label[1], label[2]), (label[3], label[4])):
+                self.port_paths.setdefault(port, set()).add(label[0])
+                self.path_ports.setdefault(label[0], set()).add(port)
+
+    def _remove_path(self, path_id):
+        self.buckets.pop(path_id, None)
+        for port in self.path_ports.pop(path_id, ()):
+            paths = self.port_paths.get(port)
+            if paths is not None:
+                paths.discard(path_id)
+                if not paths:
+                    del self.port_paths[port]
+        return self.path_groups.pop(path_id, ())
+
+    def port_down(self, dpid, port_no):
+        """Drop the paths over the port, return the groups to modify.
+
+        The groups are dicts of group_id, dpid and the surviving buckets
+        as detect_require_modify_paths of the backends returns them.
+        """
+        group_ids = set()
+        for path_id in self.port_paths.pop((dpid, port_no), ()):
+            group_ids.update(self._remove_path(path_id))
+        group_flows = []
+        for group_id in sorted(group_ids):
+            group_dpid, path_ids = self.groups[group_id]
+            path_ids = [path_id for path_id in path_ids
+                        if path_id in self.buckets]
+            self.groups[group_id] = (group_dpid, path_ids)
+            group = {}
+            group['group_id'] = group_id
+            group['dpid'] = group_dpid
+            group['buckets'] = [self.buckets[path_id]
+                                for path_id in path_ids]
+            group_flows.append(group)
+        return group_flows
+
+    def ports_down(self, ports):
+        """port_down for each (dpid, port_no), every group once."""
+        group_flows = {}
+        for dpid, port_no in ports:
+            for group in self.port_down(dpid, port_no):
+                #The later the port, the fewer buckets survive.
+                group_flows[group['group_id']] = group
+        return [group_flows[group_id] for group_id in sorted(group_flows)]
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 cloudysunny14.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import time
+
+LOG = logging.getLogger(__name__)
+
+class FlowBatch(object):
+    """Stands in for a datapath and collects the messages sent to it.
+
+    Everything but send_msg is passed to the datapath, so the helpers
+    which build messages for a datapath take a FlowBatch as well.
+    Messages the mirror finds redundant are dropped, unless an earlier
+    message of the batch changes the same entry. The mirror takes the
+    messages as installed when they are flushed.
+    """
+
+    def __init__(self, datapath, mirror=None):
+        self.datapath = datapath
+        self.mirror = mirror
+        self.msgs = []
+        self.keys = set()   # (kind, id) of the entries msgs change
+
+    def __getattr__(self, name):
+        return getattr(self.datapath, name)
+
+    def send_msg(self, msg):
+        if msg.xid is None:
+            self.datapath.set_xid(msg)
+        msg.serialize()
+        mirror = self.mirror
+        if mirror is not None:
+            key = mirror.key(msg)
+            if key is not None:
+                if key not in self.keys and (key[0], None) not in self.keys \
+                   and mirror.suppress(self.datapath.id, msg, record=False):
+                    return
+                self.keys.add(key)
+        self.msgs.append(msg)
+
+    def flush(self):
+        """Send the messages and a barrier in one write, return its xid."""
+        datapath = self.datapath
+        buf = bytearray()
+        for msg in self.msgs:
+            if self.mirror is not None:
+                self.mirror.record(datapath.id, msg)
+            buf += msg.buf
+        barrier = datapath.ofproto_parser.OFPBarrierRequest(datapath)
+        xid = datapath.set_xid(barrier)
+        barrier.serialize()
+        buf += barrier.buf
+        datapath.send(buf)
+        self.msgs = []
+        self.keys.clear()
+        return xid
+
+class FlowTransaction(object):
+    """Messages to several datapaths which are installed as a whole.
+
+    callback(transaction) is called once every switch replied to its
+    barrier, or after the tracker timeout; then elapsed is None.
+    """
+
+    def __init__(self, tracker, callback=None):
+        self.tracker = tracker
+        self.callback = callback
+        self.batches = {}       # dpid => FlowBatch
+        self.pending = set()    # (dpid, xid) of the unanswered barriers
+        self.started = None
+        self.elapsed = None
+        self.size = 0
+
+    def datapath(self, datapath):
+        """Return the FlowBatch to send messages to datapath with."""
+        batch = self.batches.get(datapath.id)
+        if batch is None:
+            batch = self.batches[datapath.id] = FlowBatch(datapath,
+                                                          self.tracker.mirror)
+        return batch
+
+    def __len__(self):
+        return sum(len(batch.msgs) for batch in self.batches.values())
+
+    def commit(self):
+        self.started = time.time()
+        self.size = len(self)
+        for dpid, batch in self.batches.items():
+            if not batch.msgs:
+                continue
+            xid = batch.flush()
+            self.pending.add((dpid, xid))
+            self.tracker.waiting[(dpid, xid)] = self
+        if not self.pending:
+            self._complete(0.)
+
+    def discard(self):
+        """Drop the messages, nothing is sent and callback is not called."""
+        self.batches.clear()
+
+    def _complete(self, elapsed):
+        self.elapsed = elapsed
+        if self.callback is not None:
+            self.callback(self)
+
+class BarrierTracker(object):
+    """Match barrier replies with the transactions that sent them."""
+
+    TIMEOUT = 5.
+
+    def __init__(self, mirror=None):
+        self.mirror = mirror
+        self.waiting = {}   # (dpid, xid) => FlowTransaction
+
+    def transaction(self, callback=None):
+        return FlowTransaction(self, callback)
+
+    def barrier_reply(self, dpid, xid):
+        """Return False if the barrier was not sent by a transaction."""
+        transaction = self.waiting.pop((dpid, xid), None)
+        if transaction is None:
+            return False
+        transaction.pending.discard((dpid, xid))
+        if not transaction.pending:
+            transaction._complete(time.time() - transaction.started)
+        return True
+
+    def expire(self, now=None):
+        """Give up the transactions whose barriers were not answered."""
+        if now is None:
+            now = time.time()
+        expired = set()
+        for key, transaction in self.waiting.items():
+            if transaction.started + self.TIMEOUT < now:
+                del self.waiting[key]
+                expired.add(transaction)
+        for transaction in expired:
+            LOG.warning('No barrier reply from %s',
+                        sorted(dpid for dpid, xid in transaction.pending))
+            transaction.pending.clear()
+            transaction._complete(None)
+        return len(expired)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 cloudysunny14.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+
+LOG = logging.getLogger(__name__)
+
+class SwitchMirror(object):
+    """Flows, groups and meters believed to be installed on a switch."""
+
+    def __init__(self):
+        self.flows = {}     # (table_id, priority, match) => flow mod body
+        self.groups = {}    # group_id => group mod body
+        self.meters = {}    # meter_id => meter mod body
+
+class FlowMirror(object):
+    """Shadow of what was sent to every switch, to drop re-installs.
+
+    A flow mod, group mod or meter mod which would install exactly what
+    the switch already has is suppressed. Messages are compared
+    serialized, without their header, so only the xid may differ.
+    Groups and meters are also compared without the command, adding an
+    existing one is a modify with the same content.
+
+    A message is only taken as installed by record, once it is sent.
+    """
+
+    def __init__(self):
+        self.switches = {}  # dpid => SwitchMirror
+        self.sent = 0
+        self.suppressed = 0
+
+    def reset(self, dpid):
+        """Forget the state of a switch, e.g. when it (re)connects."""
+        self.switches.pop(dpid, None)
+
+    def suppression_rate(self):
+        total = self.sent + self.suppressed
+        if not total:
+            return 0.
+        return float(self.suppressed) / total
+
+    def suppress(self, dpid, msg, record=True):
+        """Return True if msg, which is serialized, changes nothing.
+
+        Unless record is False, msg is taken as installed as well.
+        """
+        is_redundant = self._update(dpid, msg, record)
+        if is_redundant is None:
+            return False
+        if is_redundant:
+            self.suppressed += 1
+        else:
+            self.sent += 1
+        return is_redundant
+
+    def record(self, dpid, msg):
+        """Take msg, which is serialized, as installed on the switch."""
+        self._update(dpid, msg, True)
+
+    def key(self, msg):
+        """Return (kind, id) of the entry msg changes, or None.
+
+        id is None when msg may change every entry of its kind.
+        """
+        ofproto = msg.datapath.ofproto
+        parser = msg.datapath.ofproto_parser
+        if isinstance(msg, parser.OFPFlowMod):
+            if msg.command in (ofproto.OFPFC_DELETE,
+                               ofproto.OFPFC_DELETE_STRICT):
+                return ('flow', None)
+            return ('flow', self._flow_key(msg))
+        elif isinstance(msg, parser.OFPGroupMod):
+            if msg.group_id == ofproto.OFPG_ALL:
+                return ('group', None)
+            return ('group', msg.group_id)
+        elif isinstance(msg, parser.OFPMeterMod):
+            if msg.meter_id == ofproto.OFPM_ALL:
+                return ('meter', None)
+            return ('meter', msg.meter_id)
+        return None
+
+    def _update(self, dpid, msg, apply):
+        ofproto = msg.datapath.ofproto
+        parser = msg.datapath.ofproto_parser
+        mirror = self.switches.get(dpid)
+        if mirror is None:
+            mirror = self.switches[dpid] = SwitchMirror()
+        body = bytes(msg.buf[ofproto.OFP_HEADER_SIZE:])
+        if isinstance(msg, parser.OFPFlowMod):
+            is_redundant = self._flow_mod(ofproto, mirror.flows, msg, body,
+                                          apply)
+        elif isinstance(msg, parser.OFPGroupMod):
+            is_redundant = self._mod(mirror.groups, msg.group_id, body[2:],
+                                     msg.command == ofproto.OFPGC_DELETE,
+                                     ofproto.OFPG_ALL, apply)
+        elif isinstance(msg, parser.OFPMeterMod):
+            is_redundant = self._mod(mirror.meters, msg.meter_id, body[2:],
+                                     msg.command == ofproto.OFPMC_DELETE,
+                                     ofproto.OFPM_ALL, apply)
+        else:
+            return None
+        return is_redundant
+
+    def _flow_key(self, msg):
+        match = bytearray()
+        msg.match.serialize(match, 0)
+        return (msg.table_id, msg.priority, bytes(match))
+
+    def _flow_mod(self, ofproto, flows, msg, body, apply):
+        if msg.command in (ofproto.OFPFC_DELETE, ofproto.OFPFC_DELETE_STRICT):
+            #Non-strict deletes match more than the key, forget the table.
+            if apply:
+                for flow_key in flows.keys():
+                    if msg.table_id in (flow_key[0], ofproto.OFPTT_ALL):
+                        del flows[flow_key]
+            return False
+        key = self._flow_key(msg)
+        if flows.get(key) == body:
+            return True
+        if not apply:
+            pass
+        elif msg.command == ofproto.OFPFC_ADD:
+            flows[key] = body
+        else:
+            #A modify keeps fields of the installed flow we don't know.
+            flows.pop(key, None)
+        return False
+
+    def _mod(self, entries, entry_id, body, is_delete, all_id, apply):
+        if is_delete:
+            if not apply:
+                pass
+            elif entry_id == all_id:
+                entries.clear()
+            else:
+                entries.pop(entry_id, None)
+            return False
+        if entries.get(entry_id) == body:
+            return True
+        if apply:
+            entries[entry_id] = body
+        return False
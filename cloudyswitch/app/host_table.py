@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 cloudysunny14.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+
+LOG = logging.getLogger(__name__)
+
+class HostTable(object):
+    """In-memory table of the end hosts learned from ARP packets.
+
+    Each entry has the same layout as a row of arp_table,
+    (dpid, port_no, mac_addr, ip_addr), and is indexed by both
+    mac address and ip address.
+    """
+
+    def __init__(self):
+        self.by_mac = {}
+        self.by_ip = {}
+
+    def __len__(self):
+        return len(self.by_mac)
+
+    def add(self, entry):
+        """Register entry, the first host wins on a duplicate address."""
+        self.by_mac.setdefault(entry[2], entry)
+        self.by_ip.setdefault(entry[3], entry)
+
+    def learn(self, dpid, port_no, mac_addr, ip_addr):
+        """Return (entry, is_new) for the host that sent an ARP packet."""
+        entry = self.by_mac.get(mac_addr)
+        if entry is not None:
+            return entry, False
+        entry = (dpid, port_no, mac_addr, ip_addr)
+        self.add(entry)
+        return entry, True
+
+    def get_by_mac(self, mac_addr):
+        return self.by_mac.get(mac_addr)
+
+    def get_by_ip(self, ip_addr):
+        return self.by_ip.get(ip_addr)
+
+    def clear(self):
+        self.by_mac.clear()
+        self.by_ip.clear()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 cloudysunny14.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools
+import logging
+from ryu.lib import hub
+import db
+from memory_storage import MemoryBackend, _join_path_ids
+
+import psycopg2
+
+LOG = logging.getLogger(__name__)
+
+class Journal(object):
+    """Write-behind queue of db statements.
+
+    Entries are (statement name, params) and are written in order by
+    one greenthread. Whatever is queued while a batch is written goes
+    into the next one, up to BATCH entries in a single transaction.
+    put blocks while MAX_DEPTH entries are waiting, so a db which falls
+    behind slows down its writers instead of growing the queue.
+
+    A batch which fails stays at the head of the journal and is retried
+    after a growing delay. A lost connection is retried as it is, any
+    other error splits the batch in halves, so that an entry the db
+    refuses is dropped alone after RETRIES attempts. close waits up to
+    CLOSE_TIMEOUT for the journal to be written, the db may be down.
+    """
+
+    MAX_DEPTH = 10000
+    BATCH = 500
+    RETRIES = 3
+    RETRY_DELAY = .1
+    MAX_RETRY_DELAY = 5
+    CLOSE_TIMEOUT = 10.
+
+    def __init__(self, write):
+        self.write = write
+        self.queue = hub.Queue(self.MAX_DEPTH)
+        self.pending = []       # entries taken from queue, not written yet
+        self.thread = hub.spawn(self._loop)
+
+    def __len__(self):
+        return self.queue.qsize() + len(self.pending)
+
+    def put(self, name, *params):
+        self.queue.put((name, params))
+
+    def _take(self):
+        if not self.pending:
+            self.pending.append(self.queue.get())
+        while len(self.pending) < self.BATCH:
+            try:
+                self.pending.append(self.queue.get_nowait())
+            except hub.QueueEmpty:
+                break
+
+    def _done(self, count):
+        del self.pending[:count]
+        for _ in range(count):
+            self.queue.task_done()
+
+    def _loop(self):
+        batch = self.BATCH
+        failures = 0
+        delay = 0
+        while True:
+            self._take()
+            entries = self.pending[:batch]
+            try:
+                self.write(entries)
+            except Exception as e:
+                LOG.exception('Failed to write %d journal entries',
+                              len(entries))
+                failures += 1
+                if isinstance(e, (psycopg2.OperationalError,
+                                  psycopg2.InterfaceError)):
+                    pass
+                elif len(entries) > 1:
+                    batch = (len(entries) + 1) // 2
+                    failures = 0
+                elif failures >= self.RETRIES:
+                    LOG.error('Drop journal entry %s', entries[0])
+                    self._done(1)
+                    failures = 0
+                delay = min(delay * 2 or self.RETRY_DELAY,
+                            self.MAX_RETRY_DELAY)
+                hub.sleep(delay)
+                continue
+            self._done(len(entries))
+            batch = min(batch * 2, self.BATCH)
+            failures = 0
+            delay = 0
+
+    def flush(self, timeout=None):
+        """Wait until every queued entry is written.
+
+        Return False if it took longer than timeout seconds.
+        """
+        with hub.Timeout(timeout, False):
+            self.queue.join()
+            return True
+        return False
+
+    def close(self):
+        if not self.flush(self.CLOSE_TIMEOUT):
+            LOG.error('Abandon %d journal entries which were not written',
+                      len(self))
+        hub.kill(self.thread)
+
+class JournalBackend(MemoryBackend):
+    """In-memory backend whose tables are written behind to Postgres.
+
+    Routes are decided on the dicts of MemoryBackend, so a packet-in
+    never waits for the db. Every change is queued to a Journal as the
+    statements that apply it to the tables, with the ids assigned in
+    memory. restore loads the tables back into memory.
+    """
+
+    def __init__(self):
+        super(JournalBackend, self).__init__()
+        self.journal = Journal(db.write_journal)
+
+    def clean_tables(self):
+        self.journal.flush()
+        db.clean_tables()
+        super(JournalBackend, self).clean_tables()
+
+    def restore(self):
+        self.journal.flush()
+        tables = db.fetch_tables()
+        super(JournalBackend, self).clean_tables()
+        for host in tables['hosts']:
+            self.hosts.add(host)
+        for path in tables['all_paths']:
+            self.paths[path[0]] = path
+            self.path_ids.setdefault(path[1:5], []).append(path[0])
+        for path_id, dpid, port_no in tables['all_paths_desc']:
+            self.path_desc.setdefault(path_id, []).append((dpid, port_no))
+            self.port_paths.setdefault((dpid, port_no), []).append(path_id)
+        for label in tables['all_labels']:
+            self.labels.setdefault(label[0], []).append(label)
+        group_paths = {}
+        for group_id, path_id in tables['all_group_paths']:
+            group_paths.setdefault(group_id, []).append(path_id)
+        for group_id, dpid in tables['all_groups']:
+            path_list = group_paths.get(group_id, [])
+            self.groups[group_id] = (dpid, path_list)
+            self.group_ids[_join_path_ids(path_list)] = group_id
+            for path_id in path_list:
+                self.path_groups.setdefault(path_id, set()).add(group_id)
+            grouping_label = self._grouping_labels(path_list)
+            self.failover.add_group(
+                group_id, dpid, grouping_label,
+                self._single_labels(path_list, grouping_label))
+        self._path_seq = itertools.count(max([0] + list(self.paths)) + 1)
+        self._label_seq = itertools.count(
+            max([0] + [label[5] for labels in self.labels.values()
+                       for label in labels]) + 1)
+        self._group_seq = itertools.count(max([0] + list(self.groups)) + 1)
+
+    def handle_arp_packet(self, arppkt, dpid, port_no):
+        is_new = self.hosts.get_by_mac(arppkt.src_mac) is None
+        try:
+            return super(JournalBackend, self).handle_arp_packet(
+                arppkt, dpid, port_no)
+        finally:
+            if is_new:
+                self.journal.put('insert_host',
+                                 *self.hosts.get_by_mac(arppkt.src_mac))
+
+    def _register_path(self, path, src_port, dst_port):
+        path_id = super(JournalBackend, self)._register_path(
+            path, src_port, dst_port)
+        hops = self.path_desc[path_id[0]]
+        self.journal.put('journal_path', *self.paths[path_id[0]])
+        self.journal.put('insert_path_descs', list(path_id) * len(hops),
+                         range(len(hops)), [hop[0] for hop in hops],
+                         [hop[1] for hop in hops])
+        return path_id
+
+    def _register_labels(self, path_id):
+        start = len(self.labels.get(path_id, []))
+        prev_label = super(JournalBackend, self)._register_labels(path_id)
+        labels = self.labels[path_id][start:]
+        if labels:
+            self.journal.put('insert_labels',
+                             *[list(column) for column in zip(*labels)])
+        return prev_label
+
+    def fetch_group_flows(self, paths):
+        group_flow = super(JournalBackend, self).fetch_group_flows(paths)
+        group_id = group_flow['group_flow']['group_id']
+        dpid, path_list = self.groups[group_id]
+        self.journal.put('journal_group', group_id, dpid,
+                         _join_path_ids(path_list))
+        self.journal.put('insert_group_paths', group_id, path_list)
+        return group_flow
+
+    def detect_require_modify_paths(self, dpid, port_no):
+        unavailable_paths = sorted(self.port_paths.get((dpid, port_no), []))
+        group_ids = set()
+        for path_id in unavailable_paths:
+            group_ids.update(self.path_groups.get(path_id, ()))
+        group_flows = super(JournalBackend, self).detect_require_modify_paths(
+            dpid, port_no)
+        if unavailable_paths:
+            self.journal.put('delete_paths_labels', unavailable_paths)
+            self.journal.put('delete_group_paths', unavailable_paths)
+            self.journal.put('update_groups_paths', sorted(group_ids))
+        return group_flows
+
+    def close(self):
+        self.journal.close()
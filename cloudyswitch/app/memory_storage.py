@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 cloudysunny14.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools
+import logging
+from host_table import HostTable
+from storage import Backend
+from storage import ArpTableNotFoundException, GroupAlreadyExistException
+
+LOG = logging.getLogger(__name__)
+
+def _join_path_ids(path_ids):
+    return ','.join(str(i) for i in path_ids)
+
+class MemoryBackend(Backend):
+    """Backend which keeps every table in indexed dicts.
+
+    Nothing is persisted, so it fits a single controller deployment
+    where restarting means relearning the network.
+    """
+
+    def __init__(self):
+        super(MemoryBackend, self).__init__()
+        self.hosts = HostTable()
+        self._path_seq = itertools.count(1)
+        self._label_seq = itertools.count(1)
+        self._group_seq = itertools.count(1)
+        self._init_tables()
+
+    def _init_tables(self):
+        self.paths = {}             # path_id => path row
+        self.path_ids = {}          # (src_dpid, src_port_no,
+                                    #  dst_dpid, dst_port_no) => [path_id]
+        self.path_desc = {}         # path_id => [(dpid, port_no)]
+        self.port_paths = {}        # (dpid, port_no) => [path_id]
+        self.labels = {}            # path_id => [label row]
+        self.groups = {}            # group_id => (dpid, [path_id])
+        self.group_ids = {}         # including_path => group_id
+        self.path_groups = {}       # path_id => set(group_id)
+
+    def clean_tables(self):
+        self.hosts.clear()
+        self.failover.clear()
+        self._init_tables()
+
+    def handle_arp_packet(self, arppkt, dpid, port_no):
+        src_port, is_new = self.hosts.learn(dpid, port_no,
+                                            arppkt.src_mac, arppkt.src_ip)
+        dst_port = self.hosts.get_by_ip(arppkt.dst_ip)
+        if dst_port is None:
+            raise ArpTableNotFoundException(
+                  msg='NotFound dst_port in arptable')
+        return src_port, dst_port
+
+    def _register_path(self, path, src_port, dst_port):
+        path_id = next(self._path_seq)
+        key = (src_port[0], src_port[1], dst_port[0], dst_port[1])
+        self.paths[path_id] = (path_id,) + key + (len(path),)
+        self.path_ids.setdefault(key, []).append(path_id)
+        hops = []
+        for port in path:
+            hop = (port.dpid, port.port_no)
+            hops.append(hop)
+            self.port_paths.setdefault(hop, []).append(path_id)
+        self.path_desc[path_id] = hops
+        return (path_id,)
+
+    def handle_paths(self, path_list, src_port, dst_port):
+        key = (src_port[0], src_port[1], dst_port[0], dst_port[1])
+        path_ids = [(path_id,) for path_id in self.path_ids.get(key, [])]
+        if not len(path_ids):
+            for path in path_list:
+                path_ids.append(self._register_path(path, src_port, dst_port))
+        return path_ids
+
+    def _register_labels(self, path_id):
+        target_dst_dpid = self.paths[path_id][3]
+        hops = self.path_desc.get(path_id, [])
+        labels = self.labels.setdefault(path_id, [])
+        prev_label = -1
+        for index in range(0, len(hops) - 1, 2):
+            src_port = hops[index]
+            dst_port = hops[index + 1]
+            label = next(self._label_seq)
+            labels.append((path_id, src_port[0], src_port[1], dst_port[0],
+                           dst_port[1], label, prev_label, target_dst_dpid))
+            prev_label = label
+        return prev_label
+
+    def fetch_label_flows(self, path_id):
+        prev_label = self._register_labels(path_id)
+        return list(self.labels[path_id]), prev_label
+
+    def _grouping_labels(self, path_ids):
+        labels = [label for path_id in path_ids
+                  for label in self.labels.get(path_id, [])
+                  if label[6] == -1]
+        labels.sort(key=lambda label: label[5])
+        return labels
+
+    def _single_labels(self, path_ids, grouping_label):
+        grouped_label = set(label[5] for label in grouping_label)
+        labels = [label for path_id in path_ids
+                  for label in self.labels.get(path_id, [])
+                  if label[5] not in grouped_label]
+        labels.sort(key=lambda label: label[5])
+        return labels
+
+    def _create_buckets(self, grouping_label):
+        buckets = []
+        for label in grouping_label:
+            watch = {}
+            watch['watch'] = (label[2])
+            watch['label'] = (label[2], label[5], label[6])
+            buckets.append(watch)
+        return buckets
+
+    def fetch_group_flows(self, paths):
+        path_list = list(paths)
+        including_path = _join_path_ids(path_list)
+        if including_path in self.group_ids:
+            raise GroupAlreadyExistException(
+              msg='Group entry is alread exsit.')
+        last_labels = [self._register_labels(path_id)
+                       for path_id in path_list]
+        grouping_label = self._grouping_labels(path_list)
+        #All labels are owns same dpid.
+        dpid = grouping_label[0][1]
+        group_id = next(self._group_seq)
+        self.groups[group_id] = (dpid, path_list)
+        self.group_ids[including_path] = group_id
+        for path_id in path_list:
+            self.path_groups.setdefault(path_id, set()).add(group_id)
+        group = {}
+        group['group_id'] = group_id
+        group['dpid'] = dpid
+        group['buckets'] = self._create_buckets(grouping_label)
+        single_labels = self._single_labels(path_list, grouping_label)
+        self.failover.add_group(group_id, dpid, grouping_label, single_labels)
+        group_flow = {}
+        group_flow['group_flow'] = group
+        group_flow['label_flow'] = single_labels
+        group_flow['last_label'] = last_labels
+        return group_flow
+
+    def _host_at(self, dpid, port_no):
+        for host in self.hosts.by_mac.values():
+            if host[0] == dpid and host[1] == port_no:
+                return host
+        return None
+
+    def fetch_switch_state(self, dpid):
+        state = {}
+        state['hosts'] = [host for host in self.hosts.by_mac.values()
+                          if host[0] == dpid]
+        state['groups'] = []
+        for group_id in sorted(self.groups):
+            group_dpid, path_list = self.groups[group_id]
+            if group_dpid != dpid or not path_list:
+                continue
+            buckets = self._create_buckets(self._grouping_labels(path_list))
+            path = self.paths[path_list[0]]
+            dst_port = self._host_at(path[3], path[4])
+            if not buckets or dst_port is None:
+                continue
+            group = {}
+            group['group_id'] = group_id
+            group['dpid'] = group_dpid
+            group['buckets'] = buckets
+            state['groups'].append((group, dst_port))
+        label_flows = []
+        last_labels = []
+        for labels in self.labels.values():
+            label_flows.extend(label for label in labels
+                               if label[1] == dpid and label[6] != -1)
+            if labels and labels[-1][7] == dpid:
+                last_labels.append(labels[-1][5])
+        label_flows.sort(key=lambda label: label[5])
+        state['label_flows'] = label_flows
+        state['last_labels'] = sorted(last_labels)
+        return state
+
+    def detect_require_modify_paths(self, dpid, port_no):
+        unavailable_paths = set(self.port_paths.get((dpid, port_no), []))
+        group_ids = set()
+        for path_id in unavailable_paths:
+            self.labels.pop(path_id, None)
+            group_ids.update(self.path_groups.pop(path_id, ()))
+        group_flows = []
+        for group_id in sorted(group_ids):
+            group_dpid, path_list = self.groups[group_id]
+            including_path = _join_path_ids(path_list)
+            if self.group_ids.get(including_path) == group_id:
+                del self.group_ids[including_path]
+            path_list = sorted(path_id for path_id in path_list
+                               if path_id not in unavailable_paths)
+            self.groups[group_id] = (group_dpid, path_list)
+            self.group_ids[_join_path_ids(path_list)] = group_id
+            group = {}
+            group['group_id'] = group_id
+            group['dpid'] = group_dpid
+            group['buckets'] = self._create_buckets(
+                                   self._grouping_labels(path_list))
+            group_flows.append(group)
+        return group_flows
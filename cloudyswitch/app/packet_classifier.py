@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 cloudysunny14.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Read the headers a packet in is dispatched on straight from its data.
+
+Building a ryu Packet decodes every protocol of the frame, while the
+switches only need the ethertype, the ARP fields and the two first TLVs
+of our own LLDP frames.
+"""
+
+import struct
+from ryu.lib.dpid import str_to_dpid
+from ryu.lib.packet import arp
+from ryu.lib.packet import ethernet
+from ryu.lib.packet import lldp
+from ryu.topology.switches import LLDPPacket
+
+ETH_TYPE_OFFSET = 12
+
+def ethertype(data):
+    """Return the ethertype of an ethernet frame, or None if too short."""
+    if len(data) < ethernet.ethernet._MIN_LEN:
+        return None
+    return struct.unpack_from('!H', data, ETH_TYPE_OFFSET)[0]
+
+def parse_arp(data):
+    """Return the arp of an ARP frame, or None if it is truncated."""
+    payload = data[ethernet.ethernet._MIN_LEN:]
+    if len(payload) < arp.arp._MIN_LEN:
+        return None
+    return arp.arp.parser(payload)[0]
+
+def _lldp_tlv(data, offset, tlv_type):
+    (typelen, subtype) = struct.unpack_from('!HB', data, offset)
+    if typelen >> lldp.LLDP_TLV_TYPE_SHIFT != tlv_type:
+        raise LLDPPacket.LLDPUnknownFormat(
+            msg='unexpected tlv type %d' %
+                (typelen >> lldp.LLDP_TLV_TYPE_SHIFT))
+    length = typelen & lldp.LLDP_TLV_LENGTH_MASK
+    if length < 1:
+        raise LLDPPacket.LLDPUnknownFormat(msg='empty tlv')
+    start = offset + lldp.LLDP_TLV_SIZE + 1
+    end = offset + lldp.LLDP_TLV_SIZE + length
+    if end > len(data):
+        raise LLDPPacket.LLDPUnknownFormat(msg='truncated tlv')
+    return subtype, str(data[start:end]), end
+
+def parse_lldp(data):
+    """Return (src_dpid, src_port_no) like LLDPPacket.lldp_parse.
+
+    Raise LLDPPacket.LLDPUnknownFormat if the frame was not sent by
+    LLDPPacket.lldp_packet.
+    """
+    try:
+        subtype, chassis_id, offset = _lldp_tlv(
+            data, ethernet.ethernet._MIN_LEN, lldp.LLDP_TLV_CHASSIS_ID)
+        if subtype != lldp.ChassisID.SUB_LOCALLY_ASSIGNED:
+            raise LLDPPacket.LLDPUnknownFormat(
+                msg='unknown chassis id subtype %d' % subtype)
+        if not chassis_id.startswith(LLDPPacket.CHASSIS_ID_PREFIX):
+            raise LLDPPacket.LLDPUnknownFormat(
+                msg='unknown chassis id format %s' % chassis_id)
+        src_dpid = str_to_dpid(
+            chassis_id[LLDPPacket.CHASSIS_ID_PREFIX_LEN:])
+        subtype, port_id, offset = _lldp_tlv(data, offset,
+                                             lldp.LLDP_TLV_PORT_ID)
+    except (struct.error, AssertionError, ValueError):
+        raise LLDPPacket.LLDPUnknownFormat(msg='malformed lldp')
+    if subtype != lldp.PortID.SUB_PORT_COMPONENT:
+        raise LLDPPacket.LLDPUnknownFormat(
+            msg='unknown port id subtype %d' % subtype)
+    if len(port_id) != LLDPPacket.PORT_ID_SIZE:
+        raise LLDPPacket.LLDPUnknownFormat(
+            msg='unknown port id %s' % port_id)
+    (src_port_no, ) = struct.unpack(LLDPPacket.PORT_ID_STR, port_id)
+    return src_dpid, src_port_no
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 cloudysunny14.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import cPickle as pickle
+import logging
+import os
+import sys
+import time
+from eventlet.green import subprocess
+from ryu.lib import hub
+from topology_util import PathList, k_shortest_paths
+
+LOG = logging.getLogger(__name__)
+
+_WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       'route_precompute.py')
+
+def all_pairs_paths(graph, sources, k=None, max_hops=None):
+    """Return [(src_dpid, dst_dpid, paths)] from sources to every switch.
+
+    Paths are lists of dpids, as returned by k_shortest_paths.
+    """
+    dpids = set(graph)
+    for dsts in graph.values():
+        dpids.update(dsts)
+    routes = []
+    for src_dpid in sources:
+        for dst_dpid in sorted(dpids):
+            if src_dpid == dst_dpid:
+                continue
+            routes.append((src_dpid, dst_dpid,
+                           k_shortest_paths(graph, src_dpid, dst_dpid,
+                                            k, max_hops)))
+    return routes
+
+class RoutePrecomputer(object):
+    """Compute the routes of all switch pairs in worker processes.
+
+    The path search is CPU bound and would stall the hub, so it runs in
+    PROCESSES child processes which get a snapshot of the graph. The
+    results fill the path cache, unless the topology changed meanwhile;
+    then they are dropped and the next run picks up the new version.
+    """
+
+    PROCESSES = 2
+    #Wait for a burst of link events to settle before computing.
+    DELAY = 1.
+    #Cache entries filled between two yields to the hub.
+    BATCH = 200
+
+    def __init__(self, topology, path_cache, k=None, max_hops=None):
+        self.topology = topology
+        self.path_cache = path_cache
+        self.k = k
+        self.max_hops = max_hops
+        self.is_active = True
+        self.computed_version = None
+        self.event = hub.Event()
+        self.thread = hub.spawn(self._loop)
+
+    def schedule(self):
+        """Recompute the routes for the current topology version."""
+        self.event.set()
+
+    def close(self):
+        self.is_active = False
+        self.event.set()
+        hub.joinall([self.thread])
+
+    def _loop(self):
+        while self.is_active:
+            self.event.wait()
+            self.event.clear()
+            if not self.is_active:
+                break
+            hub.sleep(self.DELAY)
+            version = self.topology.version
+            if version == self.computed_version:
+                continue
+            try:
+                self._precompute(version)
+            except Exception:
+                LOG.exception('Route precomputation failed')
+
+    def _precompute(self, version):
+        start = time.time()
+        #The edges of the inline search, so both find the same paths.
+        graph = self.topology.compact().adjacency()
+        sources = sorted(graph)
+        processes = [self._spawn_worker(graph, sources[index::self.PROCESSES])
+                     for index in range(self.PROCESSES)
+                     if sources[index::self.PROCESSES]]
+        results = []
+        hub.joinall([hub.spawn(self._communicate, process, request, results)
+                     for process, request in processes])
+        if len(results) != len(processes):
+            LOG.error('Route workers failed, routes are computed on demand')
+            return
+        if self.topology.version != version:
+            LOG.debug('Topology changed, drop routes of version %d', version)
+            self.event.set()
+            return
+        path_list = PathList(self.topology)
+        count = 0
+        for routes in results:
+            for src_dpid, dst_dpid, paths in routes:
+                self.path_cache.put(src_dpid, dst_dpid,
+                                    path_list.createPathPorts(paths))
+                count += 1
+                if count % self.BATCH == 0:
+                    hub.sleep(0)
+                    if self.topology.version != version:
+                        self.event.set()
+                        return
+        self.computed_version = version
+        LOG.info('Precomputed %d routes of topology version %d in %.3fs',
+                 count, version, time.time() - start)
+
+    def _spawn_worker(self, graph, sources):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(sys.path)
+        process = subprocess.Popen([sys.executable, _WORKER],
+                                   stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE, env=env)
+        request = pickle.dumps((graph, sources, self.k, self.max_hops),
+                               pickle.HIGHEST_PROTOCOL)
+        return process, request
+
+    def _communicate(self, process, request, results):
+        output = process.communicate(request)[0]
+        if process.returncode != 0:
+            LOG.error('Route worker exited with %d', process.returncode)
+            return
+        results.append(pickle.loads(output))
+
+def main():
+    graph, sources, k, max_hops = pickle.load(sys.stdin)
+    pickle.dump(all_pairs_paths(graph, sources, k, max_hops), sys.stdout,
+                pickle.HIGHEST_PROTOCOL)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 cloudysunny14.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+
+LOG = logging.getLogger(__name__)
+
+#(version, statements) applied in order, each version exactly once.
+MIGRATIONS = [
+    (1, ['CREATE TABLE IF NOT EXISTS arp_table (dpid integer, \
+          port_no integer, mac_addr varchar, ip_addr varchar)',
+         'CREATE TABLE IF NOT EXISTS path_table (path_id serial primary key, \
+          src_dpid integer, src_port_no integer, dst_dpid integer, \
+          dst_port_no integer, cost smallint)',
+         'CREATE TABLE IF NOT EXISTS path_desc_table (path_id int REFERENCES \
+          path_table(path_id), path_seq integer, dpid integer, \
+          port_no integer)',
+         'CREATE TABLE IF NOT EXISTS label_table (path_id integer REFERENCES \
+          path_table(path_id), src_dpid integer, src_port_no integer, \
+          dst_dpid integer, dst_port_no integer, label serial, \
+          prev_label integer, target_dst_dpid integer)',
+         'CREATE TABLE IF NOT EXISTS group_table (group_id serial primary key, \
+          dpid integer, including_path varchar)']),
+    (2, ['CREATE UNIQUE INDEX arp_table_mac_addr_idx ON arp_table (mac_addr)',
+         'CREATE INDEX arp_table_ip_addr_idx ON arp_table (ip_addr)',
+         'CREATE INDEX path_table_port_idx ON path_table \
+          (src_dpid, src_port_no, dst_dpid, dst_port_no)',
+         'ALTER TABLE path_desc_table ADD PRIMARY KEY (path_id, path_seq)',
+         'CREATE INDEX path_desc_table_port_idx ON path_desc_table \
+          (dpid, port_no)',
+         'ALTER TABLE label_table ADD PRIMARY KEY (label)',
+         'CREATE INDEX label_table_path_idx ON label_table \
+          (path_id, prev_label)',
+         'CREATE INDEX group_table_including_path_idx ON group_table \
+          (including_path)']),
+    (3, ['CREATE TABLE group_path_table (group_id integer REFERENCES \
+          group_table(group_id), path_id integer REFERENCES \
+          path_table(path_id), PRIMARY KEY (group_id, path_id))',
+         'CREATE INDEX group_path_table_path_idx ON group_path_table \
+          (path_id)',
+         'INSERT INTO group_path_table SELECT group_id, \
+          unnest(string_to_array(including_path, \',\'))::integer \
+          FROM group_table WHERE including_path <> \'\'']),
+    (4, ['CREATE INDEX label_table_src_dpid_idx ON label_table (src_dpid)',
+         'CREATE INDEX label_table_target_dst_dpid_idx ON label_table \
+          (target_dst_dpid)',
+         'CREATE INDEX label_table_prev_label_idx ON label_table \
+          (prev_label)',
+         'CREATE INDEX group_table_dpid_idx ON group_table (dpid)']),
+]
+
+def current_version(curs):
+    curs.execute('SELECT max(version) FROM schema_version')
+    return curs.fetchone()[0] or 0
+
+def migrate(curs):
+    """Bring the schema up to the latest version, return that version.
+
+    It is safe to call on every start, the applied versions are recorded
+    in schema_version and skipped. The caller commits.
+    """
+    curs.execute('CREATE TABLE IF NOT EXISTS schema_version \
+                  (version integer primary key, \
+                   applied_at timestamp DEFAULT now())')
+    #Serialize controllers that start at the same time.
+    curs.execute('LOCK TABLE schema_version IN EXCLUSIVE MODE')
+    version = current_version(curs)
+    for migration_version, statements in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        LOG.info('Apply schema migration %d', migration_version)
+        for statement in statements:
+            curs.execute(statement)
+        curs.execute('INSERT INTO schema_version (version) VALUES (%s)',
+                     (migration_version,))
+        version = migration_version
+    return version
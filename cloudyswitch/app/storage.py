@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 cloudysunny14.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+from ryu.exception import RyuException
+from failover_index import FailoverIndex
+
+LOG = logging.getLogger(__name__)
+
+class ArpTableNotFoundException(RyuException):
+    message = '%(msg)s'
+
+class GroupAlreadyExistException(RyuException):
+    message = '%(msg)s'
+
+class Backend(object):
+    """Storage of hosts, paths, labels and groups.
+
+    Rows have the layout of the Postgres tables:
+    hosts are (dpid, port_no, mac_addr, ip_addr) and labels are
+    (path_id, src_dpid, src_port_no, dst_dpid, dst_port_no, label,
+    prev_label, target_dst_dpid).
+    Registered groups are indexed in failover as well.
+    """
+
+    def __init__(self):
+        self.failover = FailoverIndex()
+
+    def clean_tables(self):
+        raise NotImplementedError()
+
+    def handle_arp_packet(self, arppkt, dpid, port_no):
+        """Learn the sender, return (src_port, dst_port) host rows.
+
+        Raise ArpTableNotFoundException if the target is unknown.
+        """
+        raise NotImplementedError()
+
+    def handle_paths(self, path_list, src_port, dst_port):
+        """Register path_list unless paths between the hosts exist.
+
+        Return the path ids as a list of (path_id,).
+        """
+        raise NotImplementedError()
+
+    def fetch_label_flows(self, path_id):
+        """Register labels for the hops of path_id.
+
+        Return (labels of the path, label of the last hop).
+        """
+        raise NotImplementedError()
+
+    def fetch_group_flows(self, paths):
+        """Register a fast failover group over the path ids.
+
+        Raise GroupAlreadyExistException if the group exists.
+        """
+        raise NotImplementedError()
+
+    def detect_require_modify_paths(self, dpid, port_no):
+        """Drop the paths through the port, return the groups to modify."""
+        raise NotImplementedError()
+
+    def detect_require_modify_ports(self, ports):
+        """Drop the paths through any of the (dpid, port_no).
+
+        Return the groups to modify, each one once with its final buckets.
+        """
+        group_flows = {}
+        for dpid, port_no in ports:
+            for group in self.detect_require_modify_paths(dpid, port_no):
+                group_flows[group['group_id']] = group
+        return [group_flows[group_id] for group_id in sorted(group_flows)]
+
+    def restore(self):
+        """Reload what is kept in memory from the persisted tables."""
+        pass
+
+    def fetch_switch_state(self, dpid):
+        """Return what has to be installed on the switch dpid.
+
+        A dict of 'hosts' behind the switch, 'groups' on it as
+        (group, host row of the destination), 'label_flows' it swaps
+        and 'last_labels' it pops.
+        """
+        raise NotImplementedError()
+
+    def statement_count(self):
+        """Return the number of db statements sent by this greenthread."""
+        return 0
+
+    def close(self):
+        """Persist what is pending, the controller is shutting down."""
+        pass
+
+def create_backend(name):
+    if name == 'postgres':
+        import db
+        return db.PostgresBackend()
+    elif name == 'memory':
+        from memory_storage import MemoryBackend
+        return MemoryBackend()
+    elif name == 'journal':
+        from journal_storage import JournalBackend
+        return JournalBackend()
+    raise ValueError('Unknown storage backend %s' % name)
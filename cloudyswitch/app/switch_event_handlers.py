@@ -16,6 +16,7 @@
 # limitations under the License.
 
 import logging
+import time
 from ryu.base import app_manager
 from ryu.ofproto.ofproto_v1_2 import OFPG_ANY
 from ryu.controller import handler
@@ -29,9 +30,14 @@ from ryu.controller import ofp_event
 from ryu.controller.handler import CONFIG_DISPATCHER
 from ryu.controller.handler import MAIN_DISPATCHER
 from ryu.controller.handler import HANDSHAKE_DISPATCHER
+from ryu.lib import hub
 import event
-import db
-from topology_util import PathList
+import storage
+from topology_util import PathCache, PathList, TopologyGraph
+from route_precompute import RoutePrecomputer
+from flow_batch import BarrierTracker
+from flow_mirror import FlowMirror
+from switch_sync import SwitchSync
 from ryu.controller.handler import set_ev_cls
 
 LOG = logging.getLogger(__name__)
@@ -39,18 +45,115 @@ LOG = logging.getLogger(__name__)
 class SwitchState(object):
     def __init__(self, switch):
         self.switch = switch
-        self.linked_status = dict([(port.port_no, False) \
-                                  for port in switch.ports])
+        #port_no => number of links from and to the port
+        self.port_links = dict([(port.port_no, 0) for port in switch.ports])
+        #Ports without links, the end nodes are behind them.
+        self.edge_ports = set(self.port_links)
+
+    def add_port(self, port_no):
+        if port_no not in self.port_links:
+            self.port_links[port_no] = 0
+            self.edge_ports.add(port_no)
+
+    def del_port(self, port_no):
+        self.port_links.pop(port_no, None)
+        self.edge_ports.discard(port_no)
+
+    def link_up(self, port_no):
+        if port_no in self.port_links:
+            self.port_links[port_no] += 1
+            self.edge_ports.discard(port_no)
+
+    def link_down(self, port_no):
+        if self.port_links.get(port_no, 0) > 0:
+            self.port_links[port_no] -= 1
+            if not self.port_links[port_no]:
+                self.edge_ports.add(port_no)
 
 class SwitchEventHandler(app_manager.RyuApp):
 
     ARP_PACKET_LEN = ethernet._MIN_LEN + arp.arp._MIN_LEN
+    #'postgres', 'memory' or 'journal', which decides routes in memory
+    #and writes the tables behind to Postgres.
+    STORAGE_BACKEND = 'postgres'
+    #Number of paths, i.e. group buckets, of a route and their length.
+    MAX_PATHS = 8
+    MAX_HOPS = None
+    #Answer ARP requests for known hosts instead of flooding them.
+    ARP_PROXY = True
+    #Number of switch pairs whose paths are cached.
+    PATH_CACHE_SIZE = 4096
+    #Compute the routes of all switch pairs in worker processes whenever
+    #the topology changes. PATH_CACHE_SIZE should cover them all.
+    PRECOMPUTE_ROUTES = False
+    #Seconds to collect link deletes for, so that the groups over a
+    #failed switch are modified once. 0 fails over every delete alone.
+    LINK_DELETE_WINDOW = .01
+    #Keep the tables of the storage over a restart. A switch which
+    #connects is asked for its entries, and only what differs from the
+    #storage is pushed to it.
+    WARM_RESTART = False
 
     def __init__(self, *args, **kwargs):
         super(SwitchEventHandler, self).__init__(*args, **kwargs)
-        db.clean_tables()
+        self.storage = storage.create_backend(self.STORAGE_BACKEND)
+        if self.WARM_RESTART:
+            self.storage.restore()
+        else:
+            self.storage.clean_tables()
         self.switches = {}
-        self.link_list = []
+        self.topology = TopologyGraph()
+        self.path_cache = PathCache(self.PATH_CACHE_SIZE)
+        self.precomputer = None
+        if self.PRECOMPUTE_ROUTES:
+            self.precomputer = RoutePrecomputer(self.topology,
+                                                self.path_cache,
+                                                self.MAX_PATHS, self.MAX_HOPS)
+        self.flow_mirror = FlowMirror()
+        self.syncs = {}             # dpid => SwitchSync
+        self.barriers = BarrierTracker(self.flow_mirror)
+        self.barrier_thread = hub.spawn(self.barrier_loop)
+        self.deleted_ports = []     # sources of the links to fail over
+        self.failover_started = None
+        self.failover_time = None   # seconds of the last failover
+        #(ports, sent group buckets) of the failovers to reconcile
+        self.reconcile_queue = hub.Queue()
+        self.reconcile_thread = hub.spawn(self.reconcile_loop)
+
+    def close(self):
+        if self.precomputer is not None:
+            self.precomputer.close()
+        hub.kill(self.barrier_thread)
+        hub.kill(self.reconcile_thread)
+        self.storage.close()
+        super(SwitchEventHandler, self).close()
+
+    def barrier_loop(self):
+        while True:
+            hub.sleep(self.barriers.TIMEOUT)
+            self.barriers.expire()
+            self.expire_syncs()
+
+    def flows_installed(self, transaction):
+        if not transaction.size:
+            return
+        if transaction.elapsed is None:
+            LOG.warning('Installing %d messages timed out', transaction.size)
+        else:
+            LOG.debug('Installed %d messages to %d switches in %.1fms, '
+                      '%.0f%% of flow mods suppressed',
+                      transaction.size, len(transaction.batches),
+                      transaction.elapsed * 1000,
+                      self.flow_mirror.suppression_rate() * 100)
+
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, MAIN_DISPATCHER)
+    def barrier_reply_handler(self, ev):
+        msg = ev.msg
+        self.barriers.barrier_reply(msg.datapath.id, msg.xid)
+
+    def topology_changed(self):
+        if self.precomputer is not None:
+            self.precomputer.schedule()
 
     def send_default_flow(self, datapath):
         parser = datapath.ofproto_parser
@@ -99,7 +202,86 @@ class SwitchEventHandler(app_manager.RyuApp):
         switch = event.switch
         datapath = switch.dp
         self.switches[datapath.id] = SwitchState(switch)
-        self.send_default_flow(datapath)
+        self.flow_mirror.reset(datapath.id)
+        if self.WARM_RESTART:
+            self.sync_switch(datapath)
+            return
+        transaction = self.barriers.transaction(self.flows_installed)
+        self.send_default_flow(transaction.datapath(datapath))
+        transaction.commit()
+
+    @handler.set_ev_cls(event.EventSwitchLeave)
+    def switch_leave_handler(self, event):
+        dpid = event.switch.dp.id
+        self.switches.pop(dpid, None)
+        self.syncs.pop(dpid, None)
+        self.flow_mirror.reset(dpid)
+
+    def send_switch_state(self, datapath, transaction):
+        """Send everything the storage holds for the switch."""
+        state = self.storage.fetch_switch_state(datapath.id)
+        batch = transaction.datapath(datapath)
+        self.send_default_flow(batch)
+        for host in state['hosts']:
+            self.process_end_hw_addr_flows(host, transaction)
+        for group, dst_port in state['groups']:
+            self.send_group_flow(group, dst_port, transaction)
+        for label in state['label_flows']:
+            self.create_swap_label_flow(batch, label[6], label[5], label[2])
+        for last_label in state['last_labels']:
+            self.create_pop_label_flow(batch, last_label)
+
+    def sync_switch(self, datapath):
+        """Ask the switch for its entries, see stats_reply."""
+        collector = BarrierTracker().transaction()
+        self.send_switch_state(datapath, collector)
+        sync = SwitchSync(datapath, collector.datapath(datapath).msgs)
+        self.syncs[datapath.id] = sync
+        for request in sync.requests():
+            datapath.send_msg(request)
+
+    def stats_reply(self, msg):
+        datapath = msg.datapath
+        sync = self.syncs.get(datapath.id)
+        if sync is None or not sync.stats_reply(msg):
+            return
+        del self.syncs[datapath.id]
+        mods, installed = sync.diff()
+        for mod in installed:
+            self.flow_mirror.record(datapath.id, mod)
+        self.send_sync_mods(datapath, mods)
+        LOG.info('Switch %s had %d of %d entries, sent %d mods',
+                 datapath.id, len(installed), len(sync.expected), len(mods))
+
+    def send_sync_mods(self, datapath, mods):
+        transaction = self.barriers.transaction(self.flows_installed)
+        batch = transaction.datapath(datapath)
+        for mod in mods:
+            batch.send_msg(mod)
+        transaction.commit()
+
+    def expire_syncs(self, now=None):
+        """Push everything to the switches whose stats did not come."""
+        if now is None:
+            now = time.time()
+        for dpid, sync in self.syncs.items():
+            if sync.started + self.barriers.TIMEOUT < now:
+                del self.syncs[dpid]
+                LOG.warning('No stats from switch %s, sending all entries',
+                            dpid)
+                self.send_sync_mods(sync.datapath, sync.expected)
+
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
+    def flow_stats_reply_handler(self, ev):
+        self.stats_reply(ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPGroupDescStatsReply, MAIN_DISPATCHER)
+    def group_desc_stats_reply_handler(self, ev):
+        self.stats_reply(ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPMeterConfigStatsReply, MAIN_DISPATCHER)
+    def meter_config_stats_reply_handler(self, ev):
+        self.stats_reply(ev.msg)
 
     @set_ev_cls(ofp_event.EventOFPErrorMsg,
                     [HANDSHAKE_DISPATCHER, CONFIG_DISPATCHER, MAIN_DISPATCHER])
@@ -108,16 +290,39 @@ class SwitchEventHandler(app_manager.RyuApp):
         self.logger.debug('OFPErrorMsg received: type=0x%02x code=0x%02x '
                               'message=%s',
                               msg.type, msg.code, utils.hex_array(msg.data))
+        #Whatever failed is not installed, don't suppress it next time.
+        self.flow_mirror.reset(msg.datapath.id)
+
+    @handler.set_ev_cls(event.EventPortAdd)
+    def port_add_handler(self, ev):
+        port = ev.port
+        switch = self.switches.get(port.dpid)
+        if switch is not None and not port.is_reserved():
+            switch.add_port(port.port_no)
+
+    @handler.set_ev_cls(event.EventPortDelete)
+    def port_del_handler(self, ev):
+        port = ev.port
+        switch = self.switches.get(port.dpid)
+        if switch is not None:
+            switch.del_port(port.port_no)
+
+    def update_port_links(self, link, is_up):
+        for port in (link.src, link.dst):
+            switch = self.switches.get(port.dpid)
+            if switch is None:
+                continue
+            if is_up:
+                switch.link_up(port.port_no)
+            else:
+                switch.link_down(port.port_no)
 
     @handler.set_ev_cls(event.EventLinkAdd)
     def link_add_handler(self, link):
-        self.link_list.append(link.link)
-        port_src = link.link.src
-        port_dst = link.link.dst
-        switch_src = self.switches[port_src.dpid]
-        switch_dst = self.switches[port_dst.dpid]
-        switch_src.linked_status[port_src.port_no] = True
-        switch_dst.linked_status[port_dst.port_no] = True
+        if self.topology.addLink(link.link):
+            self.path_cache.clear()
+            self.topology_changed()
+            self.update_port_links(link.link, True)
 
     def send_port_mod(datapath, port_no, config):
         ofp_parser = datapath.ofproto_parser
@@ -126,14 +331,89 @@ class SwitchEventHandler(app_manager.RyuApp):
 
     @handler.set_ev_cls(event.EventLinkDelete)
     def link_del_handler(self, link):
-        port_src = link.link.src
-        group_mods = db.detect_require_modify_paths(port_src.dpid, port_src.port_no)
+        if not self.deleted_ports:
+            self.failover_started = time.time()
+            if self.LINK_DELETE_WINDOW:
+                hub.spawn(self.fail_over_after, self.LINK_DELETE_WINDOW)
+        self.deleted_ports.append(link.link.src)
+        if self.topology.delLink(link.link):
+            self.path_cache.invalidate_link(link.link)
+            self.topology_changed()
+            self.update_port_links(link.link, False)
+        if not self.LINK_DELETE_WINDOW:
+            self.fail_over()
+
+    def fail_over_after(self, window):
+        hub.sleep(window)
+        self.fail_over()
+
+    def fail_over(self):
+        """Modify the groups over the ports of the deleted links.
+
+        Each group gets one group mod with the buckets which survive
+        all the deletes. The group mods come from the failover index,
+        the storage follows behind.
+        """
+        ports = [(port.dpid, port.port_no) for port in self.deleted_ports]
+        started = self.failover_started
+        self.deleted_ports = []
+        group_mods = self.storage.failover.ports_down(ports)
+        def installed(transaction):
+            self.failover_installed(ports, started, transaction)
+        transaction = self.barriers.transaction(installed)
+        self.send_group_mods(transaction, group_mods)
+        transaction.commit()
+        sent = dict((group_mod['group_id'], group_mod['buckets'])
+                    for group_mod in group_mods)
+        self.reconcile_queue.put((ports, sent))
+
+    def failover_installed(self, ports, started, transaction):
+        if not transaction.size:
+            return
+        if transaction.elapsed is None:
+            LOG.warning('Failover from %s timed out', ports)
+            return
+        #From the first link delete to the barrier replies.
+        self.failover_time = time.time() - started
+        LOG.info('Failover from %d ports: %d groups modified in %.1fms',
+                 len(ports), transaction.size, self.failover_time * 1000)
+
+    def reconcile_loop(self):
+        #One at a time, so the storage drops the ports in order.
+        while True:
+            ports, sent = self.reconcile_queue.get()
+            try:
+                self.reconcile_groups(ports, sent)
+            except Exception:
+                LOG.exception('Failed to reconcile the groups over %s', ports)
+
+    def reconcile_groups(self, ports, sent):
+        """Drop the paths over ports from the storage.
+
+        Send the group mods the failover index did not know about.
+        """
+        group_mods = self.storage.detect_require_modify_ports(ports)
+        group_mods = [group_mod for group_mod in group_mods
+                      if sent.get(group_mod['group_id']) !=
+                      group_mod['buckets']]
+        if not group_mods:
+            return
+        LOG.warning('%d groups over %s were missing in the failover index',
+                    len(group_mods), ports)
+        transaction = self.barriers.transaction(self.flows_installed)
+        self.send_group_mods(transaction, group_mods)
+        transaction.commit()
+
+    def send_group_mods(self, transaction, group_mods):
         for group_mod in group_mods:
             group_id = group_mod['group_id']
             buckets = group_mod['buckets']
             dpid = group_mod['dpid']
+            if dpid not in self.switches:
+                #Synchronized from the storage when it connects again
+                continue
             target_switch = self.switches[dpid].switch
-            datapath = target_switch.dp
+            datapath = transaction.datapath(target_switch.dp)
             parser = datapath.ofproto_parser
             ofp = datapath.ofproto
             buckets_flow = []
@@ -240,10 +520,10 @@ class SwitchEventHandler(app_manager.RyuApp):
         req = parser.OFPMeterMod(dp, ofproto.OFPMC_ADD, ofproto.OFPMF_KBPS, 1, [band])
         dp.send_msg(req)
 
-    def send_group_flow(self, group, dst_port):
+    def send_group_flow(self, group, dst_port, transaction):
         dpid = group['dpid']
         target_switch = self.switches[dpid].switch
-        datapath = target_switch.dp
+        datapath = transaction.datapath(target_switch.dp)
         parser = datapath.ofproto_parser
         ofp = datapath.ofproto
         group_id = group['group_id']
@@ -261,43 +541,63 @@ class SwitchEventHandler(app_manager.RyuApp):
         datapath.send_msg(mod)
         self.create_push_mpls_flow(datapath, group_id, dst_port)
 
-    def process_route(self, src_port, dst_port):
-        path_list = PathList(self.link_list)
-        paths = path_list.createWholePath(src_port[0], dst_port[0])
-        path_ids = db.handle_paths(paths, src_port, dst_port)
+    def find_paths(self, src_dpid, dst_dpid):
+        paths = self.path_cache.get(src_dpid, dst_dpid)
+        if paths is None:
+            path_list = PathList(self.topology)
+            paths = path_list.createWholePath(src_dpid, dst_dpid,
+                                              self.MAX_PATHS, self.MAX_HOPS)
+            self.path_cache.put(src_dpid, dst_dpid, paths)
+        return paths
+
+    def process_route(self, src_port, dst_port, transaction):
+        paths = self.find_paths(src_port[0], dst_port[0])
+        statements = self.storage.statement_count()
+        path_ids = self.storage.handle_paths(paths, src_port, dst_port)
         try:
             paths = []
             for path in path_ids:
                 paths.append(path[0])
-            group_flow = db.fetch_group_flows(paths)
+            group_flow = self.storage.fetch_group_flows(paths)
             group = group_flow['group_flow']
-            self.send_group_flow(group, dst_port)
+            self.send_group_flow(group, dst_port, transaction)
             label_flows = group_flow['label_flow']
             last_labels = group_flow['last_label']
-        except db.GroupAlreadyExistException:
+        except storage.GroupAlreadyExistException:
             return
+        finally:
+            LOG.debug('Route %s -> %s used %d db statements',
+                      src_port[2], dst_port[2],
+                      self.storage.statement_count() - statements)
         for label_flow in label_flows:
             target_switch = self.switches[label_flow[1]].switch
+            datapath = transaction.datapath(target_switch.dp)
             #Swap label entry
-            self.create_swap_label_flow(target_switch.dp,
+            self.create_swap_label_flow(datapath,
                                         label_flow[6], label_flow[5],
                                         label_flow[2])
         #Pop label entry
         for last_label in last_labels:
             if last_label != -1:
                 target_switch = self.switches[dst_port[0]].switch
-                self.create_pop_label_flow(target_switch.dp, last_label)
+                self.create_pop_label_flow(
+                    transaction.datapath(target_switch.dp), last_label)
 
     def broadcast_to_end_nodes(self, msg):
-        for switch in self.switches.values():
-            for port_no, status in switch.linked_status.items():
-                if status == False:
-                    self.arp_packet_out(switch.switch.dp, port_no, msg.data)
+        in_dpid = msg.datapath.id
+        in_port = msg.match['in_port']
+        for dpid, switch in self.switches.items():
+            port_nos = switch.edge_ports
+            if dpid == in_dpid and in_port in port_nos:
+                port_nos = port_nos - set([in_port])
+            if port_nos:
+                self.flood_packet_out(switch.switch.dp, sorted(port_nos),
+                                      msg.data)
 
-    def process_end_hw_addr_flows(self, port):
+    def process_end_hw_addr_flows(self, port, transaction):
         eth_IP = ether.ETH_TYPE_IP
         target_switch = self.switches[port[0]]
-        datapath = target_switch.switch.dp
+        datapath = transaction.datapath(target_switch.switch.dp)
         dscp_to_queue_values = {0:1, 8:1, 16:1, 24:2, 32:2, 40:2, 48:3, 56:3}
         SCAVENGER = 8
         for dscp, queue in dscp_to_queue_values.items():
@@ -321,32 +621,69 @@ class SwitchEventHandler(app_manager.RyuApp):
         msg = ev.ev.msg
         datapath = msg.datapath
         in_port = msg.match['in_port']
-        packet = Packet(msg.data)
-        arppkt = packet.get_protocol(arp.arp)
-        if arppkt.opcode == arp.ARP_REQUEST:
+        arppkt = ev.arp
+        if arppkt is None:
+            arppkt = Packet(msg.data).get_protocol(arp.arp)
+        try:
+            src_port, dst_port = self.storage.handle_arp_packet(arppkt,
+                                                    datapath.id, in_port)
+        except storage.ArpTableNotFoundException:
+            if arppkt.opcode == arp.ARP_REQUEST:
+                self.broadcast_to_end_nodes(msg)
+            return
+        if dst_port[0] not in self.switches:
+            #The switch of the target left, it is synchronized on return.
+            return
+        is_proxied = arppkt.opcode == arp.ARP_REQUEST and self.ARP_PROXY \
+                     and dst_port[2] != arppkt.src_mac
+        if arppkt.opcode == arp.ARP_REQUEST and not is_proxied:
             self.broadcast_to_end_nodes(msg)
 
-        try:
-            src_port, dst_port = db.handle_arp_packet(arppkt, datapath.id, in_port)
-            self.process_end_hw_addr_flows(src_port)
-            self.process_end_hw_addr_flows(dst_port)
-            if src_port[0] != dst_port[0]:
-                self.process_route(src_port, dst_port)
-                self.process_route(dst_port, src_port)
-            if arppkt.opcode == arp.ARP_REPLY:
+        def installed(transaction):
+            self.flows_installed(transaction)
+            #Answer once the route is in, so the host can use it.
+            if is_proxied:
+                self.send_arp_reply(datapath, in_port, arppkt, dst_port)
+            elif arppkt.opcode == arp.ARP_REPLY and \
+                 dst_port[0] in self.switches:
                 target_switch = self.switches[dst_port[0]].switch
                 self.arp_packet_out(target_switch.dp, dst_port[1], msg.data)
-        except db.ArpTableNotFoundException:
-            pass
+
+        transaction = self.barriers.transaction(installed)
+        try:
+            self.process_end_hw_addr_flows(src_port, transaction)
+            self.process_end_hw_addr_flows(dst_port, transaction)
+            if src_port[0] != dst_port[0]:
+                self.process_route(src_port, dst_port, transaction)
+                self.process_route(dst_port, src_port, transaction)
+        except:
+            #Nothing was sent, the next ARP packet installs it all.
+            transaction.discard()
+            raise
+        transaction.commit()
+
+    def send_arp_reply(self, datapath, port_no, arppkt, host):
+        """Answer arppkt on behalf of host, an arp table row."""
+        reply = Packet()
+        reply.add_protocol(ethernet(arppkt.src_mac, host[2], ETH_TYPE_ARP))
+        reply.add_protocol(arp.arp_ip(arp.ARP_REPLY, host[2], host[3],
+                                      arppkt.src_mac, arppkt.src_ip))
+        reply.serialize()
+        self.arp_packet_out(datapath, port_no, reply.data)
 
     def arp_packet_out(self, datapath, port_no, data):
+        self.flood_packet_out(datapath, [port_no], data)
+
+    def flood_packet_out(self, datapath, port_nos, data):
+        """Send data out of every port in port_nos with one packet out."""
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
-        output_port = parser.OFPActionOutput(port_no,
-                                            ofproto.OFPCML_NO_BUFFER)
+        output_ports = [parser.OFPActionOutput(port_no,
+                                               ofproto.OFPCML_NO_BUFFER)
+                        for port_no in port_nos]
         packet_out = parser.OFPPacketOut(datapath, ofproto.OFPP_ANY,
                                           ofproto.OFPP_CONTROLLER,
-                                          [output_port], data)
+                                          output_ports, data)
         datapath.send_msg(packet_out)
 
     def create_flow_mod(self, datapath, priority,
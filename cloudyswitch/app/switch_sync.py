@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 cloudysunny14.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import struct
+import time
+from ryu import utils
+
+LOG = logging.getLogger(__name__)
+
+#Offset of the match in a flow mod and in a flow stats entry.
+_FLOW_MATCH_OFFSET = 48
+
+def _flow_entry(buf, offset, end, table_id, priority):
+    """Return (key, instructions) of the match at offset."""
+    match_len = struct.unpack_from('!H', buf, offset + 2)[0]
+    match_end = offset + utils.round_up(match_len, 8)
+    key = (table_id, priority, bytes(buf[offset:match_end]))
+    return key, bytes(buf[match_end:end])
+
+class SwitchSync(object):
+    """Compare the entries a switch should have with its stats.
+
+    expected are the flow, group and meter mods which install the state
+    of the switch. The entries the switch reports are kept as the raw
+    bytes of the stats replies, which have the layout of the mods, so
+    an entry matches if it would be installed by the same mod. Extra
+    groups and meters are deleted. Extra flows are left alone, other
+    apps install flows as well.
+    """
+
+    def __init__(self, datapath, expected):
+        self.datapath = datapath
+        self.expected = expected
+        self.flows = {}         # (table_id, priority, match) => instructions
+        self.groups = {}        # group_id => (type, buckets)
+        self.meters = {}        # meter_id => (flags, bands)
+        self.pending = set()    # xids of the stats requests
+        self.started = None
+
+    def requests(self):
+        """Return the stats requests to send to the switch."""
+        datapath = self.datapath
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        requests = [parser.OFPFlowStatsRequest(datapath, 0, ofproto.OFPTT_ALL,
+                                               ofproto.OFPP_ANY,
+                                               ofproto.OFPG_ANY, 0, 0,
+                                               parser.OFPMatch()),
+                    parser.OFPGroupDescStatsRequest(datapath, 0),
+                    parser.OFPMeterConfigStatsRequest(datapath, 0,
+                                                      ofproto.OFPM_ALL)]
+        for request in requests:
+            self.pending.add(datapath.set_xid(request))
+        self.started = time.time()
+        return requests
+
+    def stats_reply(self, msg):
+        """Take the entries of a stats reply, return True after the last."""
+        if msg.xid not in self.pending:
+            return False
+        ofproto = self.datapath.ofproto
+        buf = msg.buf
+        msg_len = struct.unpack_from('!H', buf, 2)[0]
+        type_, flags = struct.unpack_from('!HH', buf, ofproto.OFP_HEADER_SIZE)
+        offset = ofproto.OFP_MULTIPART_REPLY_SIZE
+        while offset < msg_len:
+            length = struct.unpack_from('!H', buf, offset)[0]
+            if not length:
+                break
+            end = offset + length
+            if type_ == ofproto.OFPMP_FLOW:
+                table_id, = struct.unpack_from('!B', buf, offset + 2)
+                priority, = struct.unpack_from('!H', buf, offset + 12)
+                key, instructions = _flow_entry(
+                    buf, offset + _FLOW_MATCH_OFFSET, end, table_id, priority)
+                self.flows[key] = instructions
+            elif type_ == ofproto.OFPMP_GROUP_DESC:
+                group_type, group_id = struct.unpack_from('!BxI', buf,
+                                                          offset + 2)
+                self.groups[group_id] = (group_type,
+                                         bytes(buf[offset + 8:end]))
+            elif type_ == ofproto.OFPMP_METER_CONFIG:
+                meter_flags, meter_id = struct.unpack_from('!HI', buf,
+                                                           offset + 2)
+                self.meters[meter_id] = (meter_flags,
+                                         bytes(buf[offset + 8:end]))
+            offset = end
+        if not flags & ofproto.OFPMPF_REPLY_MORE:
+            self.pending.discard(msg.xid)
+        return not self.pending
+
+    def diff(self):
+        """Return (mods to send, expected mods the switch already has)."""
+        datapath = self.datapath
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        mods = []
+        installed = []
+        flows = {}
+        for mod in self.expected:
+            buf = mod.buf
+            if isinstance(mod, parser.OFPFlowMod):
+                key, instructions = _flow_entry(
+                    buf, _FLOW_MATCH_OFFSET, len(buf), mod.table_id,
+                    mod.priority)
+                if flows.get(key) == instructions:
+                    #The same flow of another route
+                    continue
+                flows[key] = instructions
+                if self.flows.get(key) == instructions:
+                    installed.append(mod)
+                else:
+                    #An add replaces the flow
+                    mods.append(mod)
+                continue
+            if isinstance(mod, parser.OFPGroupMod):
+                entry = self.groups.pop(mod.group_id, None)
+                body = (mod.type, bytes(buf[16:]))
+                modify = ofproto.OFPGC_MODIFY
+            elif isinstance(mod, parser.OFPMeterMod):
+                entry = self.meters.pop(mod.meter_id, None)
+                body = (mod.flags, bytes(buf[16:]))
+                modify = ofproto.OFPMC_MODIFY
+            else:
+                mods.append(mod)
+                continue
+            if entry == body:
+                installed.append(mod)
+                continue
+            if entry is not None:
+                #Adding an existing group or meter fails
+                mod.command = modify
+                mod.serialize()
+            mods.append(mod)
+        for group_id in sorted(self.groups):
+            mods.append(parser.OFPGroupMod(datapath, ofproto.OFPGC_DELETE,
+                                           0, group_id, []))
+        for meter_id in sorted(self.meters):
+            mods.append(parser.OFPMeterMod(datapath, ofproto.OFPMC_DELETE,
+                                           0, meter_id, []))
+        return mods, installed
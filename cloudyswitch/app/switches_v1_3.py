@@ -15,6 +15,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import heapq
+import itertools
 import logging
 import time
 
@@ -22,13 +24,12 @@ from ryu.base.app_manager import RyuApp
 from ryu.controller import ofp_event
 from ryu.controller.handler import set_ev_cls
 from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER
+from ryu.controller.handler import DEAD_DISPATCHER
 from ryu.ofproto.ofproto_v1_2 import OFPG_ANY
 from ryu.ofproto.ofproto_v1_3 import OFP_VERSION
 from ryu.lib.mac import DONTCARE_STR
-from ryu.lib.packet import ethernet
 from ryu.ofproto.ether import ETH_TYPE_LLDP
 from ryu.ofproto import ether
-from ryu.lib.packet.packet import Packet
 from ryu.topology.switches import LLDPPacket
 from ryu.topology.switches import Port, PortState
 from ryu.topology.switches import PortDataState
@@ -37,9 +38,71 @@ from ryu.topology.switches import Switch
 from ryu.lib import hub
 
 import event
+import packet_classifier
 
 LOG = logging.getLogger("switches_v1_3")
 
+class RatePacer(object):
+    """Spaces out the callers of wait() to rate per second."""
+
+    def __init__(self, rate):
+        self.interval = 1. / rate
+        self.next_time = 0.
+
+    def wait(self):
+        now = time.time()
+        send_time = max(now, self.next_time)
+        self.next_time = send_time + self.interval
+        if send_time > now:
+            hub.sleep(send_time - now)
+
+class LinkTimer(object):
+    """Deadlines of the links in a heap, the earliest first.
+
+    A link has at most one deadline armed; entries left behind in the
+    heap by a later arm() are skipped when they come up.
+    """
+
+    def __init__(self):
+        self.heap = []          # (deadline, seq, link)
+        self.deadlines = {}     # link => armed deadline
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def __contains__(self, link):
+        return link in self.deadlines
+
+    def arm(self, link, deadline):
+        """Return True if deadline became the earliest one."""
+        if self.deadlines.get(link) == deadline:
+            return False
+        earliest = self.next_deadline()
+        self.deadlines[link] = deadline
+        heapq.heappush(self.heap, (deadline, next(self._seq), link))
+        return earliest is None or deadline < earliest
+
+    def next_deadline(self):
+        heap = self.heap
+        while heap:
+            deadline, seq, link = heap[0]
+            if self.deadlines.get(link) == deadline:
+                return deadline
+            heapq.heappop(heap)
+        return None
+
+    def expired(self, now):
+        """Pop and return the links whose deadline is not after now."""
+        links = []
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            deadline, seq, link = heapq.heappop(heap)
+            if self.deadlines.get(link) == deadline:
+                del self.deadlines[link]
+                links.append(link)
+        return links
+
 class L2Switch(RyuApp):
     _EVENTS = [event.EventSwitchEnter, event.EventSwitchLeave,
                event.EventPortAdd, event.EventPortDelete,
@@ -54,18 +117,32 @@ class L2Switch(RyuApp):
 
     LLDP_SEND_GUARD = .05
     LLDP_SEND_PERIOD_PER_PORT = .9
-    TIMEOUT_CHECK_PERIOD = 15.
-    LINK_TIMEOUT = TIMEOUT_CHECK_PERIOD * 2
-    LINK_LLDP_DROP = 5
+    #LLDP frames per second to one switch, and to all of them. Switches
+    #are served in parallel, a round takes the longer of
+    #max ports per switch / LLDP_RATE_PER_SWITCH and ports / LLDP_RATE.
+    LLDP_RATE_PER_SWITCH = 1 / LLDP_SEND_GUARD
+    LLDP_RATE = 1000.
+    #A link is down once LINK_LLDP_MISSES frames of its source port went
+    #unanswered for a whole LLDP period each. The period is measured per
+    #port, it gets longer than LLDP_SEND_PERIOD_PER_PORT when the rates
+    #above do not let every port send that often.
+    LINK_LLDP_MISSES = 1
 
     def __init__(self, *args, **kwargs):
         super(L2Switch, self).__init__(*args, **kwargs)
         self.name = 'switches'
         self.dps = {}                 # datapath_id => Datapath class
         self.port_state = {}          # datapath_id => ports
+        self.port_index = {}          # datapath_id => port_no => Port
         self.ports = PortDataState()  # Port class -> PortData class
+        self.lldp_intervals = {}      # Port class -> seconds between LLDPs
         self.links = LinkState()      # Link class -> timestamp
+        self.link_timer = LinkTimer() # Link class -> expiry deadline
+        self.register_xids = {}       # datapath_id => barrier xid
         self.is_active = True
+        self.lldp_queues = {}         # datapath_id => Queue of Port
+        self.lldp_queued = set()      # Ports waiting in lldp_queues
+        self.lldp_pacer = RatePacer(self.LLDP_RATE)
         self.lldp_event = hub.Event()
         self.link_event = hub.Event()
         self.threads.append(hub.spawn(self.lldp_loop))
@@ -77,54 +154,77 @@ class L2Switch(RyuApp):
         if self.link_discovery:
             self.lldp_event.set()
             self.link_event.set()
+            for queue in self.lldp_queues.values():
+                queue.put(None)
             hub.joinall(self.threads)
 
     def lldp_loop(self):
+        """Hand the ports which are due to the sender of their switch."""
         while self.is_active:
             self.lldp_event.clear()
             now = time.time()
-            timeout = None
-            ports_now = []
-            ports = []
-            for (key, data) in self.ports.items():
-                if data.timestamp is None:
-                    ports_now.append(key)
-                    continue
-
-                expire = data.timestamp + self.LLDP_SEND_PERIOD_PER_PORT
-                if expire <= now:
-                    ports.append(key)
+            timeout = self.LLDP_SEND_PERIOD_PER_PORT
+            for (port, data) in self.ports.items():
+                if port in self.lldp_queued:
                     continue
+                if data.timestamp is not None:
+                    expire = data.timestamp + self.LLDP_SEND_PERIOD_PER_PORT
+                    if expire > now:
+                        #Ports are in the order they were sent.
+                        timeout = min(timeout, expire - now)
+                        break
+                self._queue_lldp(port)
+            self.lldp_event.wait(timeout=timeout)
 
-                timeout = expire - now
+    def _queue_lldp(self, port):
+        queue = self.lldp_queues.get(port.dpid)
+        if queue is None:
+            queue = self.lldp_queues[port.dpid] = hub.Queue()
+            self.threads.append(hub.spawn(self._lldp_sender, queue))
+        self.lldp_queued.add(port)
+        queue.put(port)
+
+    def _lldp_sender(self, queue):
+        """Send the LLDP frames of one switch at LLDP_RATE_PER_SWITCH."""
+        pacer = RatePacer(self.LLDP_RATE_PER_SWITCH)
+        while self.is_active:
+            port = queue.get()
+            if port is None:
                 break
-            for port in ports_now:
-                self.send_lldp_packet(port.dpid,
-                                      port.port_no,
-                                      port.hw_addr)
-            for port in ports:
-                self.send_lldp_packet(port.dpid,
-                                      port.port_no,
-                                      port.hw_addr)
-                hub.sleep(self.LLDP_SEND_GUARD)      # don't burst
-
-            if timeout is not None and ports:
-                timeout = 0     # We have already slept
-            self.lldp_event.wait(timeout=timeout)
+            pacer.wait()
+            self.lldp_pacer.wait()
+            self.lldp_queued.discard(port)
+            self.send_lldp_packet(port)
 
     def link_loop(self):
+        """Take down the links whose deadline passed without LLDP."""
         while self.is_active:
             self.link_event.clear()
 
             now = time.time()
             deleted = []
-            for (link, timestamp) in self.links.items():
-                if timestamp + self.LINK_TIMEOUT < now:
-                    src = link.src
-                    if src in self.ports:
-                        port_data = self.ports.get_port(src)
-                        if port_data.lldp_dropped() > self.LINK_LLDP_DROP:
-                            deleted.append(link)
+            for link in self.link_timer.expired(now):
+                timestamp = self.links.get(link)
+                if timestamp is None:
+                    # The link was already deleted
+                    continue
+                deadline = timestamp + self._link_timeout(link)
+                if deadline > now:
+                    # LLDP was received since the link was armed
+                    self.link_timer.arm(link, deadline)
+                    continue
+                src = link.src
+                if src not in self.ports:
+                    continue
+                port_data = self.ports.get_port(src)
+                if port_data.lldp_dropped() > self.LINK_LLDP_MISSES:
+                    deleted.append(link)
+                else:
+                    # The frames were held back, check after the next one
+                    sent = port_data.timestamp or now
+                    self.link_timer.arm(
+                        link, max(sent + self._lldp_interval(src), now) +
+                              self.LLDP_SEND_GUARD)
 
             for link in deleted:
                 self.links.link_down(link)
@@ -135,13 +235,27 @@ class L2Switch(RyuApp):
                 if rev_link not in deleted:
                     # It is very likely that the reverse link is also
                     # disconnected. Check it early.
-                    expire = now - self.LINK_TIMEOUT
+                    expire = now - self._link_timeout(rev_link)
                     self.links.rev_link_set_timestamp(rev_link, expire)
+                    if rev_link in self.links:
+                        self.link_timer.arm(rev_link, now)
                     if dst in self.ports:
                         self.ports.move_front(dst)
                         self.lldp_event.set()
 
-            self.link_event.wait(timeout=self.TIMEOUT_CHECK_PERIOD)
+            timeout = None
+            deadline = self.link_timer.next_deadline()
+            if deadline is not None:
+                timeout = max(deadline - time.time(), 0)
+            self.link_event.wait(timeout=timeout)
+
+    def _lldp_interval(self, port):
+        return max(self.lldp_intervals.get(port, 0),
+                   self.LLDP_SEND_PERIOD_PER_PORT)
+
+    def _link_timeout(self, link):
+        """Return how long link may go without LLDP before it is down."""
+        return (self.LINK_LLDP_MISSES + 1) * self._lldp_interval(link.src)
 
     def _get_switch(self, dpid):
         if dpid in self.dps:
@@ -151,11 +265,14 @@ class L2Switch(RyuApp):
             return switch
 
     def _get_port(self, dpid, port_no):
-        switch = self._get_switch(dpid)
-        if switch:
-            for p in switch.ports:
-                if p.port_no == port_no:
-                    return p
+        ports = self.port_index.get(dpid)
+        if ports is not None:
+            return ports.get(port_no)
+
+    def _index_port(self, dp, ofpport):
+        port = Port(dp.id, dp.ofproto, ofpport)
+        if not port.is_reserved():
+            self.port_index[dp.id][port.port_no] = port
 
     def _port_added(self, port):
         lldp_data = LLDPPacket.lldp_packet(
@@ -170,8 +287,36 @@ class L2Switch(RyuApp):
 
         self.dps[dp.id] = dp
         self.port_state[dp.id] = PortState()
+        self.port_index[dp.id] = {}
         for port in dp.ports.values():
             self.port_state[dp.id].add(port.port_no, port)
+            self._index_port(dp, port)
+
+    def _unregister(self, dp):
+        if dp.id in self.dps:
+            del self.dps[dp.id]
+            del self.port_state[dp.id]
+            del self.port_index[dp.id]
+
+    @set_ev_cls(ofp_event.EventOFPStateChange, DEAD_DISPATCHER)
+    def state_change_handler(self, ev):
+        dp = ev.datapath
+        # dp.id is None when datapath dies before handshake
+        if dp.id is None:
+            return
+        self.register_xids.pop(dp.id, None)
+        if dp.id not in self.dps:
+            return
+        switch = self._get_switch(dp.id)
+        self._unregister(dp)
+        LOG.debug('unregister %s', switch)
+        self.send_event_to_observers(event.EventSwitchLeave(switch))
+        for port in switch.ports:
+            if port in self.ports:
+                self.ports.del_port(port)
+                self.lldp_intervals.pop(port, None)
+                self._link_down(port)
+        self.lldp_event.set()
 
     def _link_down(self, port):
         try:
@@ -199,6 +344,7 @@ class L2Switch(RyuApp):
                       '(datapath id = %s, port number = %s)',
                       dp.id, ofpport.port_no)
             self.port_state[dp.id].add(ofpport.port_no, ofpport)
+            self._index_port(dp, ofpport)
             self.send_event_to_observers(
                 event.EventPortAdd(Port(dp.id, dp.ofproto, ofpport)))
 
@@ -214,16 +360,19 @@ class L2Switch(RyuApp):
             LOG.debug('A port was deleted.' +
                       '(datapath id = %s, port number = %s)',
                       dp.id, ofpport.port_no)
+            #Look it up before it is gone from the index.
+            port = self._get_port(dp.id, ofpport.port_no)
             self.port_state[dp.id].remove(ofpport.port_no)
+            self.port_index[dp.id].pop(ofpport.port_no, None)
             self.send_event_to_observers(
                 event.EventPortDelete(Port(dp.id, dp.ofproto, ofpport)))
 
             if not self.link_discovery:
                 return
 
-            port = self._get_port(dp.id, ofpport.port_no)
             if port and not port.is_reserved():
                 self.ports.del_port(port)
+                self.lldp_intervals.pop(port, None)
                 self._link_down(port)
                 self.lldp_event.set()
 
@@ -233,6 +382,7 @@ class L2Switch(RyuApp):
                       '(datapath id = %s, port number = %s)',
                       dp.id, ofpport.port_no)
             self.port_state[dp.id].modify(ofpport.port_no, ofpport)
+            self._index_port(dp, ofpport)
             self.send_event_to_observers(
                 event.EventPortModify(Port(dp.id, dp.ofproto, ofpport)))
 
@@ -262,29 +412,35 @@ class L2Switch(RyuApp):
         ofp_parser = datapath.ofproto_parser
         req = ofp_parser.OFPBarrierRequest(datapath)
         datapath.send_msg(req)
+        return req.xid
 
-    def send_lldp_packet(self, datapath_id, port_no, dl_addr):
-        datapath = self.dps.get(datapath_id, None)
-        if datapath is None:
-            #datapath was already deleted
+    def send_lldp_packet(self, port):
+        datapath = self.dps.get(port.dpid, None)
+        if datapath is None or port not in self.ports:
+            #datapath or port was already deleted
             return
+        #The frame was built once in _port_added.
+        sent = self.ports.get_port(port).timestamp
+        port_data = self.ports.lldp_sent(port)
+        if sent is not None:
+            self.lldp_intervals[port] = port_data.timestamp - sent
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
-        lldp_data = LLDPPacket.lldp_packet(datapath.id,
-                        port_no,
-                        dl_addr,
-                        self.DEFAULT_TTL)
-        output_port = parser.OFPActionOutput(port_no,
+        output_port = parser.OFPActionOutput(port.port_no,
                                             ofproto.OFPCML_NO_BUFFER)
         packet_out = parser.OFPPacketOut(datapath, ofproto.OFPP_ANY,
                                           ofproto.OFPP_CONTROLLER,
-                                          [output_port], lldp_data)
+                                          [output_port], port_data.lldp_data)
         datapath.send_msg(packet_out)
 
     @set_ev_cls(ofp_event.EventOFPBarrierReply, MAIN_DISPATCHER)
     def barrier_reply_handler(self, ev):
         msg = ev.msg
         datapath = msg.datapath
+        #Other barriers are sent by the apps to confirm their flows.
+        if self.register_xids.get(datapath.id) != msg.xid:
+            return
+        del self.register_xids[datapath.id]
         self._register(datapath)
         switch = self._get_switch(datapath.id)
         self.send_event_to_observers(event.EventSwitchEnter(switch))
@@ -320,7 +476,8 @@ class L2Switch(RyuApp):
         flow_mod = self.create_flow_mod(datapath, 0, table_id,
                                         match, instructions)
         datapath.send_msg(flow_mod)
-        self.send_barrier_request(datapath)
+        #The switch is registered when the table miss entries are in.
+        self.register_xids[datapath.id] = self.send_barrier_request(datapath)
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def _packet_in_handler(self, ev):
@@ -329,13 +486,18 @@ class L2Switch(RyuApp):
             return
         msg = ev.msg
         in_port = msg.match['in_port']
-        packet = Packet(msg.data)
-        efm = packet.get_protocol(ethernet.ethernet)
-        if efm.ethertype == ether.ETH_TYPE_ARP:
-            self.send_event_to_observers(event.EventArpReceived(ev))
+        ethertype = packet_classifier.ethertype(msg.data)
+        if ethertype == ether.ETH_TYPE_ARP:
+            arppkt = packet_classifier.parse_arp(msg.data)
+            if arppkt is not None:
+                self.send_event_to_observers(
+                    event.EventArpReceived(ev, arppkt))
+            return
+        if ethertype != ETH_TYPE_LLDP:
+            return
 
         try:
-            src_dpid, src_port_no = LLDPPacket.lldp_parse(msg.data)
+            src_dpid, src_port_no = packet_classifier.parse_lldp(msg.data)
         except LLDPPacket.LLDPUnknownFormat as e:
             # This handler can receive all the packtes which can be
             # not-LLDP packet. Ignore it silently
@@ -365,7 +527,18 @@ class L2Switch(RyuApp):
             if not link in self.links:
                 self.send_event_to_observers(event.EventLinkAdd(link))
 
-            if not self.links.update_link(src, dst):
+            # The frame sent from src came back
+            try:
+                self.ports.lldp_received(src)
+            except KeyError:
+                pass
+            reverse = self.links.update_link(src, dst)
+            if link not in self.link_timer:
+                # Re-armed lazily from the link timestamp once it is due
+                if self.link_timer.arm(link,
+                                       time.time() + self._link_timeout(link)):
+                    self.link_event.set()
+            if not reverse:
                 # reverse link is not detected yet.
                 # So schedule the check early because it's very likely it's up
                 try:
@@ -15,77 +15,344 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import heapq
 import logging
+from array import array
+from collections import OrderedDict, namedtuple
 from ryu.exception import RyuException
 
-def find_all_paths(graph, start, end, path=[]):
-    path = path + [start]
-    if start == end:
-        return [path]
-    if not graph.has_key(start):
+def shortest_path(graph, start, end, excluded_nodes=(), excluded_edges=()):
+    """Return (hops, rank, path) of the shortest path from start to end.
+
+    Ties are broken by rank, the indexes of the hops in the adjacency
+    lists, so the path found first in adjacency order wins. Return None
+    if end is unreachable.
+    """
+    heap = [(0, (), start, [start])]
+    visited = set()
+    while heap:
+        hops, rank, node, path = heapq.heappop(heap)
+        if node in visited:
+            continue
+        visited.add(node)
+        if node == end:
+            return hops, rank, path
+        for index, next_node in enumerate(graph.get(node, ())):
+            if next_node in visited or next_node in excluded_nodes or \
+               (node, next_node) in excluded_edges:
+                continue
+            heapq.heappush(heap, (hops + 1, rank + (index,), next_node,
+                                  path + [next_node]))
+    return None
+
+def k_shortest_paths(graph, start, end, k=None, max_hops=None):
+    """Return up to k loopless paths from start to end, shortest first.
+
+    This is Yen's algorithm, paths longer than max_hops links are not
+    returned. Without k and max_hops every loopless path is returned.
+    """
+    first = shortest_path(graph, start, end)
+    if first is None or (max_hops is not None and first[0] > max_hops):
         return []
-    paths = []
-    for node in graph[start]:
-        if node not in path:
-            newpaths = find_all_paths(graph, node, end, path)
-            for newpath in newpaths:
-                paths.append(newpath)
-    paths.sort(key = len)
-    return paths
+    found = [first]
+    candidates = []
+    seen = set([tuple(first[2])])
+    while k is None or len(found) < k:
+        hops, rank, last_path = found[-1]
+        for index in range(len(last_path) - 1):
+            root = last_path[:index + 1]
+            excluded_edges = set((path[index], path[index + 1])
+                                 for h, r, path in found
+                                 if path[:index + 1] == root)
+            spur = shortest_path(graph, root[-1], end,
+                                 root[:-1], excluded_edges)
+            if spur is None:
+                continue
+            path = root[:-1] + spur[2]
+            if tuple(path) in seen or \
+               (max_hops is not None and index + spur[0] > max_hops):
+                continue
+            seen.add(tuple(path))
+            heapq.heappush(candidates,
+                           (index + spur[0], rank[:index] + spur[1], path))
+        if not candidates:
+            break
+        found.append(heapq.heappop(candidates))
+    return [path for hops, rank, path in found]
 
 class LinkedPorts(object):
-    
+    """Links indexed by src dpid, then dst dpid.
+
+    Parallel links between two switches are kept in the order they were
+    added, and getLink returns the oldest one.
+    """
+
     def __init__(self):
-        self.link = {}
+        self.link = {}  # src_dpid => OrderedDict(dst_dpid => [link])
 
     def addLink(self, link):
-        link_roots = self.link.get(link.src.dpid, [])
-        link_roots.append(link)
-        self.link[link.src.dpid] = link_roots
+        dst_links = self.link.setdefault(link.src.dpid, OrderedDict())
+        dst_links.setdefault(link.dst.dpid, []).append(link)
+
+    def delLink(self, link):
+        dst_links = self.link.get(link.src.dpid)
+        if dst_links is None:
+            return False
+        links = dst_links.get(link.dst.dpid, [])
+        if link not in links:
+            return False
+        links.remove(link)
+        if not links:
+            del dst_links[link.dst.dpid]
+            if not dst_links:
+                del self.link[link.src.dpid]
+        return True
+
+    def hasLink(self, link):
+        return link in self.getLinks(link.src.dpid, link.dst.dpid)
+
+    def getLinks(self, src_dpid, dst_dpid):
+        dst_links = self.link.get(src_dpid)
+        if dst_links is None:
+            return []
+        return dst_links.get(dst_dpid, [])
 
     def getLink(self, src_dpid, dst_dpid):
-        link_roots = self.link[src_dpid]
-        for link in link_roots:
-          if link.dst.dpid == dst_dpid:
-              return link
+        links = self.getLinks(src_dpid, dst_dpid)
+        if not links:
+            return None
+        return links[0]
+
+class TopologyGraph(object):
+    """Switch graph shared by the route computations.
+
+    It is updated in place as links come and go, and version is
+    incremented on every change.
+    """
+
+    def __init__(self, link_list=()):
+        self.graph = {}     # src_dpid => [dst_dpid]
+        self.linked_ports = LinkedPorts()
+        self.version = 0
+        self._compact = None
+        for link in link_list:
+            self.addLink(link)
+
+    def compact(self):
+        """Return a CompactTopology of the current version."""
+        if self._compact is None or self._compact.version != self.version:
+            self._compact = CompactTopology(self)
+        return self._compact
+
+    def addLink(self, link):
+        if self.linked_ports.hasLink(link):
+            return False
+        self.linked_ports.addLink(link)
+        self.graph.setdefault(link.src.dpid, []).append(link.dst.dpid)
+        self.version += 1
+        return True
+
+    def delLink(self, link):
+        if not self.linked_ports.delLink(link):
+            return False
+        self.graph[link.src.dpid].remove(link.dst.dpid)
+        self.version += 1
+        return True
+
+PackedPort = namedtuple('PackedPort', ['dpid', 'port_no'])
+
+class PackedPath(object):
+    """Path of ports packed in an array as dpid, port_no, dpid, ...
+
+    Items are PackedPorts, which have dpid and port_no like the Ports
+    of the links.
+    """
+
+    __slots__ = ('hops',)
+
+    def __init__(self, hops):
+        self.hops = hops
+
+    def __len__(self):
+        return len(self.hops) // 2
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('path index out of range')
+        return PackedPort(self.hops[index * 2], self.hops[index * 2 + 1])
+
+    def __iter__(self):
+        hops = self.hops
+        for index in xrange(0, len(hops), 2):
+            yield PackedPort(hops[index], hops[index + 1])
+
+class CompactTopology(object):
+    """Read-only snapshot of a TopologyGraph in flat arrays.
+
+    Switches are numbered by dpid order and the links from switch i are
+    edges offsets[i] to offsets[i + 1] in CSR layout, in the order they
+    were added. It is a graph for shortest_path and k_shortest_paths
+    whose nodes are the switch indexes.
+    """
+
+    def __init__(self, topology):
+        links = topology.linked_ports.link
+        dpids = set(links)
+        for dst_links in links.values():
+            dpids.update(dst_links)
+        self.version = topology.version
+        #dpids are 64 bit unsigned.
+        self.dpids = array('L', sorted(dpids))
+        self.index = dict((dpid, index)
+                          for index, dpid in enumerate(self.dpids))
+        self.offsets = array('l', [0])
+        self.targets = array('l')
+        self.src_ports = array('L')
+        self.dst_ports = array('L')
+        for dpid in self.dpids:
+            #One edge per switch pair, over the oldest of parallel links.
+            for dst_links in links.get(dpid, {}).values():
+                link = dst_links[0]
+                self.targets.append(self.index[link.dst.dpid])
+                self.src_ports.append(link.src.port_no)
+                self.dst_ports.append(link.dst.port_no)
+            self.offsets.append(len(self.targets))
+
+    def get(self, node, default=None):
+        if not 0 <= node < len(self.dpids):
+            return default
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    def adjacency(self):
+        """Return the graph as dict of dpid => [dst_dpid] in edge order."""
+        return dict((dpid, [self.dpids[target] for target in self.get(index)])
+                    for index, dpid in enumerate(self.dpids))
+
+    def edge(self, src, dst):
+        """Return the index of the first edge from src to dst, or None."""
+        for edge in xrange(self.offsets[src], self.offsets[src + 1]):
+            if self.targets[edge] == dst:
+                return edge
         return None
 
+    def packPath(self, path):
+        """Return the path of switch indexes as a PackedPath."""
+        hops = array('L')
+        for index in range(len(path) - 1):
+            edge = self.edge(path[index], path[index + 1])
+            if edge is None:
+                return None
+            hops.extend((self.dpids[path[index]], self.src_ports[edge],
+                         self.dpids[path[index + 1]], self.dst_ports[edge]))
+        return PackedPath(hops)
+
 class PathList(object):
 
     class IllegalLink(RyuException):
         message = '%(msg)s'
 
     def __init__(self, link_list):
-        self.link_list = link_list
-        self.ports = {}
-        self.linked_ports = LinkedPorts()
+        """link_list is a list of links or a TopologyGraph."""
+        if isinstance(link_list, TopologyGraph):
+            self.topology = link_list
+        else:
+            self.topology = TopologyGraph(link_list)
+        self.linked_ports = self.topology.linked_ports
 
-    def _createGraph(self, link_list):
-        graph = {}
-        for link in link_list:
-            self.linked_ports.addLink(link)
-            src_dpid = link.src.dpid
-            dst_dpid = link.dst.dpid
-            linked_nodes = graph.get(src_dpid, [])
-            linked_nodes.append(dst_dpid)
-            graph[src_dpid] = linked_nodes
-        return graph
-
-    def createWholePath(self, src_dpid, dst_dpid):
-        graph = self._createGraph(self.link_list)
-        paths = find_all_paths(graph, src_dpid, dst_dpid)
-        path_ports = []
-        for path in paths:
-            ports = []
-            for index in range(len(path)-1):
-                link = self.linked_ports.getLink(path[index],
-                                                 path[index+1])
-                if link is None:
-                    raise PathList.IllegalLink(
-                          msg='Illegal link found. Can\'t create paths %s' % link)
-                else:
-                    ports.append(link.src)
-                    ports.append(link.dst)
-            path_ports.append(ports)
-        return path_ports
+    def createWholePath(self, src_dpid, dst_dpid, k=None, max_hops=None):
+        """Return up to k shortest paths as PackedPaths.
+
+        Paths longer than max_hops links are left out.
+        """
+        compact = self.topology.compact()
+        src = compact.index.get(src_dpid)
+        dst = compact.index.get(dst_dpid)
+        if src is None or dst is None:
+            return []
+        paths = k_shortest_paths(compact, src, dst, k, max_hops)
+        return [self._packPath(compact, path) for path in paths]
+
+    def createPathPorts(self, paths):
+        """Return the paths of dpids as PackedPaths."""
+        compact = self.topology.compact()
+        return [self._packPath(compact,
+                               [compact.index[dpid] for dpid in path])
+                for path in paths]
+
+    def _packPath(self, compact, path):
+        packed = compact.packPath(path)
+        if packed is None:
+            raise PathList.IllegalLink(
+                  msg='Illegal link found. Can\'t create paths %s' % path)
+        return packed
+
+def _link_key(src, dst):
+    return (src.dpid, src.port_no, dst.dpid, dst.port_no)
+
+class PathCache(object):
+    """LRU cache of the paths computed between switch pairs.
+
+    Every entry is indexed by the links its paths go through, so a link
+    delete only drops the routes which used it. A link add can make a
+    shorter path anywhere, so it clears the whole cache.
+    """
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.entries = OrderedDict()    # (src_dpid, dst_dpid) => paths
+        self.link_keys = {}             # link key => set((src, dst))
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, src_dpid, dst_dpid):
+        """Return the cached paths, or None if there are none."""
+        key = (src_dpid, dst_dpid)
+        paths = self.entries.pop(key, None)
+        if paths is None:
+            self.misses += 1
+            return None
+        self.entries[key] = paths
+        self.hits += 1
+        return paths
+
+    def put(self, src_dpid, dst_dpid, paths):
+        key = (src_dpid, dst_dpid)
+        self._remove(key)
+        while self.size and len(self.entries) >= self.size:
+            self._remove(next(iter(self.entries)))
+        self.entries[key] = paths
+        for link_key in self._links(paths):
+            self.link_keys.setdefault(link_key, set()).add(key)
+
+    def invalidate_link(self, link):
+        """Drop the entries with a path through link."""
+        keys = self.link_keys.pop(_link_key(link.src, link.dst), ())
+        for key in list(keys):
+            self._remove(key)
+        return len(keys)
+
+    def clear(self):
+        self.entries.clear()
+        self.link_keys.clear()
+
+    def _links(self, paths):
+        return set(_link_key(path[index], path[index + 1])
+                   for path in paths
+                   for index in range(0, len(path) - 1, 2))
 
+    def _remove(self, key):
+        paths = self.entries.pop(key, None)
+        if paths is None:
+            return
+        for link_key in self._links(paths):
+            keys = self.link_keys.get(link_key)
+            if keys is None:
+                continue
+            keys.discard(key)
+            if not keys:
+                del self.link_keys[link_key]
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 cloudysunny14.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Memory and path search time of the topology at 1000 switches.
+
+Compares the dict of lists graph with Link and Port objects against the
+CompactTopology arrays, from the cloudyswitch directory:
+
+    $ python -m benchmarks.compact_topology
+"""
+
+import random
+import sys
+import time
+import types
+
+from ryu.ofproto import ofproto_v1_3
+from ryu.ofproto import ofproto_v1_3_parser
+from ryu.topology.switches import Port, Link
+
+from app.topology_util import PathList, TopologyGraph, k_shortest_paths
+
+SWITCHES = 1000
+LINKS = 20000
+PATHS = 8
+SAMPLES = 20
+
+def create_links():
+    random.seed(0)
+    port_nos = {}
+    pairs = set()
+    links = []
+    while len(links) < LINKS:
+        src, dst = random.sample(range(1, SWITCHES + 1), 2)
+        if (src, dst) in pairs:
+            continue
+        pairs.add((src, dst))
+        pairs.add((dst, src))
+        src_port = port_nos[src] = port_nos.get(src, 0) + 1
+        dst_port = port_nos[dst] = port_nos.get(dst, 0) + 1
+        links.append(Link(create_port(src, src_port),
+                          create_port(dst, dst_port)))
+        links.append(Link(create_port(dst, dst_port),
+                          create_port(src, src_port)))
+    return links
+
+def create_port(dpid, port_no):
+    ofpport = ofproto_v1_3_parser.OFPPort(port_no, '00:00:00:00:00:00',
+                                          'port', 0, 0, 0, 0, 0, 0, 0, 0)
+    return Port(dpid, ofproto_v1_3, ofpport)
+
+def deep_size(obj, seen=None):
+    """Bytes of obj and of everything it references, modules excluded."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen or isinstance(obj, (types.ModuleType, type)):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += deep_size(key, seen) + deep_size(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += deep_size(item, seen)
+    if hasattr(obj, '__dict__'):
+        size += deep_size(obj.__dict__, seen)
+    for name in getattr(type(obj), '__slots__', ()):
+        if hasattr(obj, name):
+            size += deep_size(getattr(obj, name), seen)
+    return size
+
+def object_paths(topology, src_dpid, dst_dpid):
+    """Paths as lists of the Ports of the links, without the arrays."""
+    paths = k_shortest_paths(topology.graph, src_dpid, dst_dpid, PATHS)
+    path_ports = []
+    for path in paths:
+        ports = []
+        for index in range(len(path) - 1):
+            link = topology.linked_ports.getLink(path[index], path[index + 1])
+            ports.append(link.src)
+            ports.append(link.dst)
+        path_ports.append(ports)
+    return path_ports
+
+def main():
+    topology = TopologyGraph(create_links())
+    pairs = [random.sample(range(1, SWITCHES + 1), 2) for i in range(SAMPLES)]
+    start = time.time()
+    compact = topology.compact()
+    build = time.time() - start
+    graph_size = deep_size((topology.graph, topology.linked_ports))
+    compact_size = deep_size(compact)
+
+    start = time.time()
+    object_results = [object_paths(topology, src, dst) for src, dst in pairs]
+    object_time = time.time() - start
+    path_list = PathList(topology)
+    start = time.time()
+    packed_results = [path_list.createWholePath(src, dst, PATHS)
+                      for src, dst in pairs]
+    packed_time = time.time() - start
+    for object_paths_, packed_paths in zip(object_results, packed_results):
+        assert [[(port.dpid, port.port_no) for port in path]
+                for path in object_paths_] == \
+               [list(path) for path in packed_paths]
+    #The Ports are shared with the links, count only the lists.
+    link_ports = set(id(port)
+                     for dst_links in topology.linked_ports.link.values()
+                     for links in dst_links.values()
+                     for link in links for port in (link.src, link.dst))
+    object_path_size = deep_size(object_results, link_ports)
+    packed_path_size = deep_size(packed_results)
+
+    print '%d switches, %d links, %d paths of %d switch pairs' % \
+        (SWITCHES, LINKS, PATHS, SAMPLES)
+    print 'compact build %.3fs' % build
+    print '%-10s %14s %14s %14s' % ('', 'graph(KiB)', 'paths(KiB)',
+                                    'search(ms)')
+    print '%-10s %14d %14d %14.1f' % ('objects', graph_size // 1024,
+                                      object_path_size // 1024,
+                                      object_time * 1000 / SAMPLES)
+    print '%-10s %14d %14d %14.1f' % ('compact', compact_size // 1024,
+                                      packed_path_size // 1024,
+                                      packed_time * 1000 / SAMPLES)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 cloudysunny14.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Lookup latency of the hot db queries at 10k hosts and 100k paths.
+
+Runs against its own database, from the cloudyswitch directory:
+
+    $ psql -d postgres -U postgres
+    postgres=# create database ryu_bench;
+    $ python -m benchmarks.db_lookup ["dbname=ryu_bench user=postgres"]
+
+Every query is measured with the schema indexes, and again inside a
+transaction that drops them and is rolled back afterwards.
+"""
+
+import random
+import sys
+import time
+
+import psycopg2
+
+from app import db
+from app import schema
+
+HOSTS = 10000
+PATHS = 100000
+PORTS_PER_PATH = 8
+SWITCHES = 1000
+SAMPLES = 1000
+SEQSCAN_SAMPLES = 20
+
+INDEXES = ['arp_table_mac_addr_idx', 'arp_table_ip_addr_idx',
+           'path_table_port_idx', 'path_desc_table_port_idx',
+           'label_table_path_idx', 'group_table_including_path_idx',
+           'group_path_table_path_idx']
+CONSTRAINTS = [('path_desc_table', 'path_desc_table_pkey'),
+               ('label_table', 'label_table_pkey'),
+               ('group_path_table', 'group_path_table_pkey')]
+
+ARP_STATEMENTS = {
+    'fetch_host_by_mac': ('varchar',
+                          'SELECT * FROM arp_table WHERE mac_addr = $1'),
+    'fetch_host_by_ip': ('varchar',
+                         'SELECT * FROM arp_table WHERE ip_addr = $1'),
+}
+
+def populate(curs):
+    curs.execute('DELETE FROM group_path_table')
+    curs.execute('DELETE FROM path_desc_table')
+    curs.execute('DELETE FROM label_table')
+    curs.execute('DELETE FROM path_table')
+    curs.execute('DELETE FROM group_table')
+    curs.execute('DELETE FROM arp_table')
+    curs.execute('INSERT INTO arp_table SELECT i %% %d, i, \
+                  \'mac-\' || i, \'ip-\' || i FROM generate_series(1, %d) i' %
+                 (SWITCHES, HOSTS))
+    curs.execute('INSERT INTO path_table (path_id, src_dpid, src_port_no, \
+                  dst_dpid, dst_port_no, cost) SELECT i, i %% %d, i, \
+                  (i + 1) %% %d, i + 1, %d FROM generate_series(1, %d) i' %
+                 (SWITCHES, SWITCHES, PORTS_PER_PATH, PATHS))
+    curs.execute('INSERT INTO path_desc_table SELECT p, s, (p + s) %% %d, s \
+                  FROM generate_series(1, %d) p, generate_series(0, %d) s' %
+                 (SWITCHES, PATHS, PORTS_PER_PATH - 1))
+    curs.execute('INSERT INTO label_table SELECT p, p %% %d, 1, p %% %d, 2, \
+                  (p - 1) * %d + h, CASE WHEN h = 1 THEN -1 \
+                  ELSE (p - 1) * %d + h - 1 END, (p + 1) %% %d \
+                  FROM generate_series(1, %d) p, generate_series(1, %d) h' %
+                 (SWITCHES, SWITCHES, PORTS_PER_PATH // 2, PORTS_PER_PATH // 2,
+                  SWITCHES, PATHS, PORTS_PER_PATH // 2))
+    curs.execute('INSERT INTO group_table (dpid, including_path) \
+                  SELECT i %% %d, i || \',\' || (i + 1) \
+                  FROM generate_series(1, %d, 2) i' % (SWITCHES, PATHS))
+    curs.execute('INSERT INTO group_path_table SELECT group_id, \
+                  unnest(string_to_array(including_path, \',\'))::integer \
+                  FROM group_table')
+    curs.execute('ANALYZE')
+
+def prepare(curs, statements):
+    for name, (types, query) in statements.items():
+        if types:
+            types = '(%s)' % types
+        curs.execute('PREPARE %s %s AS %s' % (name, types, query))
+
+def samples():
+    host = random.randint(1, HOSTS)
+    path_id = random.randint(1, PATHS)
+    return {
+        'fetch_host_by_mac': ('mac-%d' % host,),
+        'fetch_host_by_ip': ('ip-%d' % host,),
+        'fetch_path_id': (path_id % SWITCHES, path_id,
+                          (path_id + 1) % SWITCHES, path_id + 1),
+        'fetch_port_paths': (random.randint(0, SWITCHES - 1),
+                             random.randint(0, PORTS_PER_PATH - 1)),
+        'fetch_path_labels': (path_id,),
+        'fetch_grouping_labels': ([path_id, path_id + 1],),
+        'count_group': ('%d,%d' % (path_id, path_id + 1),),
+        'fetch_path_group_ids': ([path_id],),
+    }
+
+def measure(curs, count):
+    elapsed = {}
+    for i in range(count):
+        for name, params in samples().items():
+            start = time.time()
+            curs.execute('EXECUTE %s (%s)' %
+                         (name, ', '.join(['%s'] * len(params))), params)
+            curs.fetchall()
+            elapsed[name] = elapsed.get(name, 0) + time.time() - start
+    return dict((name, total * 1000000 / count)
+                for name, total in elapsed.items())
+
+def main():
+    dsn = 'dbname=ryu_bench user=postgres'
+    if len(sys.argv) > 1:
+        dsn = sys.argv[1]
+    conn = psycopg2.connect(dsn)
+    curs = conn.cursor()
+    schema.migrate(curs)
+    populate(curs)
+    conn.commit()
+    statements = dict(ARP_STATEMENTS)
+    statements.update((name, db.STATEMENTS[name]) for name in
+                      ['fetch_path_id', 'fetch_port_paths', 'fetch_path_labels',
+                       'fetch_grouping_labels', 'count_group',
+                       'fetch_path_group_ids'])
+    prepare(curs, statements)
+    indexed = measure(curs, SAMPLES)
+    for index in INDEXES:
+        curs.execute('DROP INDEX %s' % index)
+    for table, constraint in CONSTRAINTS:
+        curs.execute('ALTER TABLE %s DROP CONSTRAINT %s' % (table, constraint))
+    seqscan = measure(curs, SEQSCAN_SAMPLES)
+    conn.rollback()
+    print '%d hosts, %d paths, %d path_desc rows' % \
+        (HOSTS, PATHS, PATHS * PORTS_PER_PATH)
+    print '%-24s %12s %12s' % ('query', 'indexed(us)', 'no index(us)')
+    for name in sorted(indexed):
+        print '%-24s %12.1f %12.1f' % (name, indexed[name], seqscan[name])
+    conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 cloudysunny14.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""getLink, addLink and delLink of LinkedPorts against a flat link list.
+
+From the cloudyswitch directory:
+
+    $ python -m benchmarks.linked_ports
+"""
+
+import random
+import time
+
+from app.topology_util import LinkedPorts
+from benchmarks.compact_topology import create_links
+
+LOOKUPS = 200000
+
+class FlatLinkedPorts(object):
+    """LinkedPorts as it was, a list of links per src dpid."""
+
+    def __init__(self):
+        self.link = {}
+
+    def addLink(self, link):
+        self.link.setdefault(link.src.dpid, []).append(link)
+
+    def delLink(self, link):
+        self.link[link.src.dpid].remove(link)
+
+    def getLink(self, src_dpid, dst_dpid):
+        for link in self.link[src_dpid]:
+            if link.dst.dpid == dst_dpid:
+                return link
+        return None
+
+def measure(linked_ports, links, hops, deleted):
+    start = time.time()
+    for link in links:
+        linked_ports.addLink(link)
+    add = time.time() - start
+    start = time.time()
+    for src_dpid, dst_dpid in hops:
+        linked_ports.getLink(src_dpid, dst_dpid)
+    get = time.time() - start
+    start = time.time()
+    for link in deleted:
+        linked_ports.delLink(link)
+    delete = time.time() - start
+    return (add * 1000000 / len(links), get * 1000000 / len(hops),
+            delete * 1000000 / len(links))
+
+def main():
+    links = create_links()
+    random.seed(1)
+    hops = [(link.src.dpid, link.dst.dpid)
+            for link in random.sample(links, 1000)] * (LOOKUPS // 1000)
+    deleted = list(links)
+    random.shuffle(deleted)
+    print '%d links, %d lookups' % (len(links), len(hops))
+    print '%-8s %10s %10s %10s' % ('', 'add(us)', 'get(us)', 'del(us)')
+    for name, linked_ports in [('flat', FlatLinkedPorts()),
+                               ('indexed', LinkedPorts())]:
+        print '%-8s %10.2f %10.2f %10.2f' % \
+            ((name,) + measure(linked_ports, links, hops, deleted))
+
+if __name__ == '__main__':
+    main()
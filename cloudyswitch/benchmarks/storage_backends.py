@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 cloudysunny14.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare the storage backends on the same route install workload.
+
+From the cloudyswitch directory:
+
+    $ python -m benchmarks.storage_backends ["dbname=ryu_bench user=postgres"]
+
+The Postgres backend is skipped when the database can not be reached.
+"""
+
+import collections
+import random
+import sys
+import time
+
+from app import storage
+
+HOSTS = 200
+SWITCHES = 20
+ROUTES = 500
+PATHS_PER_ROUTE = 4
+HOPS = 4
+FAILURES = 50
+
+ArpPacket = collections.namedtuple('ArpPacket', 'src_mac src_ip dst_ip')
+PathPort = collections.namedtuple('PathPort', 'dpid port_no')
+
+def create_workload():
+    rand = random.Random(1)
+    hosts = [(rand.randint(1, SWITCHES), 100 + i,
+              '02:00:00:00:%02x:%02x' % (i // 256, i % 256), '10.0.%d.%d' %
+              (i // 256, i % 256)) for i in range(HOSTS)]
+    routes = []
+    for i in range(ROUTES):
+        src, dst = rand.sample(hosts, 2)
+        paths = []
+        for j in range(PATHS_PER_ROUTE):
+            path = [PathPort(src[0], 1 + j)]
+            for hop in range(HOPS - 1):
+                dpid = rand.randint(1, SWITCHES)
+                path.append(PathPort(dpid, rand.randint(1, 8)))
+                path.append(PathPort(dpid, rand.randint(1, 8)))
+            path.append(PathPort(dst[0], 1 + j))
+            paths.append(path)
+        routes.append((src, dst, paths))
+    failures = [(rand.randint(1, SWITCHES), rand.randint(1, 8))
+                for i in range(FAILURES)]
+    return hosts, routes, failures
+
+def run(backend, workload):
+    hosts, routes, failures = workload
+    backend.clean_tables()
+    elapsed = collections.OrderedDict()
+    start = time.time()
+    for index, host in enumerate(hosts):
+        target = hosts[index - 1]
+        arppkt = ArpPacket(host[2], host[3], target[3])
+        try:
+            backend.handle_arp_packet(arppkt, host[0], host[1])
+        except storage.ArpTableNotFoundException:
+            pass
+    elapsed['handle_arp_packet'] = (time.time() - start) / len(hosts)
+    start = time.time()
+    for src, dst, paths in routes:
+        path_ids = backend.handle_paths(paths, src, dst)
+        try:
+            backend.fetch_group_flows([path[0] for path in path_ids])
+        except storage.GroupAlreadyExistException:
+            pass
+    elapsed['route install'] = (time.time() - start) / len(routes)
+    start = time.time()
+    for dpid, port_no in failures:
+        backend.detect_require_modify_paths(dpid, port_no)
+    elapsed['link failure'] = (time.time() - start) / len(failures)
+    return elapsed
+
+def main():
+    workload = create_workload()
+    results = collections.OrderedDict()
+    results['memory'] = run(storage.create_backend('memory'), workload)
+    try:
+        from app import db
+        from app.db_pool import ConnectionPool
+        if len(sys.argv) > 1:
+            db.pool = ConnectionPool(sys.argv[1], db.POOL_SIZE)
+        else:
+            db.pool = ConnectionPool('dbname=ryu_bench user=postgres',
+                                     db.POOL_SIZE)
+        results['postgres'] = run(storage.create_backend('postgres'),
+                                  workload)
+    except Exception as e:
+        print 'Skip postgres backend: %s' % e
+    print '%d hosts, %d routes of %d paths, %d link failures' % \
+        (HOSTS, ROUTES, PATHS_PER_ROUTE, FAILURES)
+    print '%-20s' % 'operation' + ''.join('%14s' % ('%s(us)' % name)
+                                          for name in results)
+    for operation in results['memory']:
+        print '%-20s' % operation + ''.join(
+            '%14.1f' % (elapsed[operation] * 1000000)
+            for elapsed in results.values())
+
+if __name__ == '__main__':
+    main()
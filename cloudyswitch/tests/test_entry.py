@@ -15,15 +15,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import time
 import unittest
 import logging
 from nose.tools import eq_
 from ryu.ofproto import ofproto_v1_3_parser
 from ryu.ofproto import ofproto_v1_3
 
-from app import db
+from app.memory_storage import MemoryBackend
 from app.topology_util import PathList
 import test_util
+try:
+    from app import db
+    from app.journal_storage import Journal, JournalBackend
+    import psycopg2
+except ImportError:
+    db = None
 
 LOG = logging.getLogger(__name__)
 
@@ -36,11 +43,16 @@ class Test_entry(unittest.TestCase):
     """
 
     def setUp(self):
-        db.clean_tables()
+        if db is None:
+            raise unittest.SkipTest('psycopg2 is not installed')
+        try:
+            db.clean_tables()
+        except psycopg2.OperationalError:
+            raise unittest.SkipTest('Postgres is not available')
         db.fetch('select setval (\'label_table_label_seq\', 1, false)')
         db.fetch('select setval (\'path_table_path_id_seq\', 1, false)')
         db.fetch('select setval (\'group_table_group_id_seq\', 1, false)')
-        pass
+        self.storage = db.PostgresBackend()
 
     def tearDown(self):
         pass
@@ -48,6 +60,11 @@ class Test_entry(unittest.TestCase):
     def _createSwitches(self):
         return None
 
+    def _addHosts(self, *hosts):
+        for host in hosts:
+            db.execute_prepared('insert_host', *host)
+            db.hosts.add(host)
+
     def _compareMatchField(self, match):
         jsondict = match.to_jsondict()
         # from_jsondict
@@ -84,15 +101,17 @@ class Test_entry(unittest.TestCase):
         paths = self._createPaths(src_port, dst_port)
         src_port_arp_table = (4, 3, '62:1e:dd:aa:41:9e', '10.0.0.2')
         dst_port_arp_table = (5, 3, '96:06:4d:e3:70:50', '10.0.0.3')
-        path_ids = db.handle_paths(paths, src_port_arp_table,
-                                   dst_port_arp_table)
-        label_flows, last_label = db.fetch_label_flows(path_ids[0][0])
+        path_ids = self.storage.handle_paths(paths, src_port_arp_table,
+                                             dst_port_arp_table)
+        label_flows, last_label = self.storage.fetch_label_flows(
+            path_ids[0][0])
         eq_([(1, 4, 1, 1, 3, 1, -1, 5), (1, 1, 4, 5, 1, 2, 1, 5)],
             label_flows)
         paths = self._createPaths(dst_port, src_port)
-        path_ids = db.handle_paths(paths, dst_port_arp_table,
-                                   src_port_arp_table)
-        label_flows, last_label = db.fetch_label_flows(path_ids[0][0])
+        path_ids = self.storage.handle_paths(paths, dst_port_arp_table,
+                                             src_port_arp_table)
+        label_flows, last_label = self.storage.fetch_label_flows(
+            path_ids[0][0])
         eq_([(7, 5, 2, 2, 4, 3, -1, 4), (7, 2, 3, 4, 2, 4, 3, 4)],
             label_flows)
 
@@ -101,9 +120,10 @@ class Test_entry(unittest.TestCase):
         paths = self._createPaths(src_port, dst_port)
         src_port_arp_table = (4, 3, '62:1e:dd:aa:41:9e', '10.0.0.2')
         dst_port_arp_table = (3, 3, '96:06:4d:e3:70:53', '10.0.0.4')
-        path_ids = db.handle_paths(paths, src_port_arp_table,
-                                   dst_port_arp_table)
-        label_flows, last_label = db.fetch_label_flows(path_ids[0][0])
+        path_ids = self.storage.handle_paths(paths, src_port_arp_table,
+                                             dst_port_arp_table)
+        label_flows, last_label = self.storage.fetch_label_flows(
+            path_ids[0][0])
         eq_([(13, 4, 1, 1, 3, 5, -1, 3), (13, 1, 2, 3, 1, 6, 5, 3)],
             label_flows)
 
@@ -112,9 +132,10 @@ class Test_entry(unittest.TestCase):
         paths = self._createPaths(src_port, dst_port)
         src_port_arp_table = (5, 3, '96:06:4d:e3:70:50', '10.0.0.3')
         dst_port_arp_table = (3, 3, '96:06:4d:e3:70:53', '10.0.0.4')
-        path_ids = db.handle_paths(paths, src_port_arp_table,
-                                   dst_port_arp_table)
-        label_flows, label_label = db.fetch_label_flows(path_ids[1][0])
+        path_ids = self.storage.handle_paths(paths, src_port_arp_table,
+                                             dst_port_arp_table)
+        label_flows, label_label = self.storage.fetch_label_flows(
+            path_ids[1][0])
         eq_([(20, 5, 1, 1, 4, 7, -1, 3), (20, 1, 2, 3, 1, 8, 7, 3)],
             label_flows)
 
@@ -124,11 +145,11 @@ class Test_entry(unittest.TestCase):
         paths = self._createPaths(src_port, dst_port)
         src_port_arp_table = (4, 3, '62:1e:dd:aa:41:9e', '10.0.0.2')
         dst_port_arp_table = (5, 3, '96:06:4d:e3:70:50', '10.0.0.3')
-        path_ids = db.handle_paths(paths, src_port_arp_table,
-                                   dst_port_arp_table)
+        path_ids = self.storage.handle_paths(paths, src_port_arp_table,
+                                             dst_port_arp_table)
         p_path = path_ids[0][0]
         b_path = path_ids[1][0]
-        group_flows = db.fetch_group_flows((p_path, b_path))
+        group_flows = self.storage.fetch_group_flows((p_path, b_path))
         expect_flows = {'last_label': [2L, 4L], 
                         'group_flow': {'buckets': [{'watch': 1, 'label': (1, 1, -1)},
                         {'watch': 2, 'label': (2, 3, -1)}], 'group_id': 1L, 'dpid': 4},
@@ -143,16 +164,239 @@ class Test_entry(unittest.TestCase):
         src_port_arp_table = (4, 3, '62:1e:dd:aa:41:9e', '10.0.0.2')
         dst_port_arp_table = (5, 3, '96:06:4d:e3:70:50', '10.0.0.3')
         #Assume that already created paths
-        path_ids = db.handle_paths(paths, src_port_arp_table,
-                                   dst_port_arp_table)
+        path_ids = self.storage.handle_paths(paths, src_port_arp_table,
+                                             dst_port_arp_table)
         p_path = path_ids[0][0]
         b_path = path_ids[1][0]
-        db.fetch_group_flows((p_path, b_path))
-        flow_mod = db.detect_require_modify_paths(1, 4)
+        self.storage.fetch_group_flows((p_path, b_path))
+        flow_mod = self.storage.detect_require_modify_paths(1, 4)
         expect_flow = [{'buckets': [{'watch': 2, 'label': (2, 3, -1)}],
                          'group_id': 1, 'dpid': 4}]
         eq_(flow_mod, expect_flow)
 
+    def testFailoverIndex(self):
+        src_port = test_util.createPort(4, 3)
+        dst_port = test_util.createPort(5, 3)
+        paths = self._createPaths(src_port, dst_port)
+        src_port_arp_table = (4, 3, '62:1e:dd:aa:41:9e', '10.0.0.2')
+        dst_port_arp_table = (5, 3, '96:06:4d:e3:70:50', '10.0.0.3')
+        path_ids = self.storage.handle_paths(paths, src_port_arp_table,
+                                             dst_port_arp_table)
+        p_path = path_ids[0][0]
+        b_path = path_ids[1][0]
+        self.storage.fetch_group_flows((p_path, b_path))
+        #The index answers as the storage does
+        failover = self.storage.failover
+        eq_(failover.port_down(1, 4),
+            self.storage.detect_require_modify_paths(1, 4))
+        eq_(failover.port_down(1, 4), [])
+        eq_(failover.port_down(5, 2),
+            [{'buckets': [], 'group_id': 1, 'dpid': 4}])
+        eq_(failover.port_paths, {})
+
+    def testFailoverPorts(self):
+        src_port = test_util.createPort(4, 3)
+        dst_port = test_util.createPort(5, 3)
+        paths = self._createPaths(src_port, dst_port)
+        src_port_arp_table = (4, 3, '62:1e:dd:aa:41:9e', '10.0.0.2')
+        dst_port_arp_table = (5, 3, '96:06:4d:e3:70:50', '10.0.0.3')
+        path_ids = self.storage.handle_paths(paths, src_port_arp_table,
+                                             dst_port_arp_table)
+        p_path = path_ids[0][0]
+        b_path = path_ids[1][0]
+        self.storage.fetch_group_flows((p_path, b_path))
+        #One group with the buckets left after both ports are down
+        expect_flow = [{'buckets': [], 'group_id': 1, 'dpid': 4}]
+        ports = [(1, 4), (4, 2)]
+        eq_(self.storage.failover.ports_down(ports), expect_flow)
+        eq_(self.storage.detect_require_modify_ports(ports), expect_flow)
+
+    def testSwitchState(self):
+        src_port = test_util.createPort(4, 3)
+        dst_port = test_util.createPort(5, 3)
+        paths = self._createPaths(src_port, dst_port)
+        src_port_arp_table = (4, 3, '62:1e:dd:aa:41:9e', '10.0.0.2')
+        dst_port_arp_table = (5, 3, '96:06:4d:e3:70:50', '10.0.0.3')
+        self._addHosts(src_port_arp_table, dst_port_arp_table)
+        path_ids = self.storage.handle_paths(paths, src_port_arp_table,
+                                             dst_port_arp_table)
+        p_path = path_ids[0][0]
+        b_path = path_ids[1][0]
+        self.storage.fetch_group_flows((p_path, b_path))
+        state = self.storage.fetch_switch_state(4)
+        eq_(state['hosts'], [src_port_arp_table])
+        eq_(state['groups'], [({'buckets': [{'watch': 1, 'label': (1, 1, -1)},
+                                            {'watch': 2, 'label': (2, 3, -1)}],
+                                'group_id': 1, 'dpid': 4},
+                               dst_port_arp_table)])
+        eq_(state['label_flows'], [])
+        eq_(state['last_labels'], [])
+        state = self.storage.fetch_switch_state(1)
+        eq_(state['groups'], [])
+        eq_(state['label_flows'], [(1, 1, 4, 5, 1, 2, 1, 5)])
+        eq_(self.storage.fetch_switch_state(5)['last_labels'], [2, 4])
+
+class _BrokenConnection(object):
+    """Connection whose cursor or commit fails as if it was lost."""
+
+    def __init__(self, conn, fail_cursor=False, fail_commit=False):
+        self.conn = conn
+        self.fail_cursor = fail_cursor
+        self.fail_commit = fail_commit
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def cursor(self):
+        if self.fail_cursor:
+            raise psycopg2.OperationalError('server closed the connection')
+        return self.conn.cursor()
+
+    def commit(self):
+        self.conn.commit()
+        if self.fail_commit:
+            raise psycopg2.OperationalError('server closed the connection')
+
+class Test_transactional(unittest.TestCase):
+    """ Test case for cloudyswitch.db.transactional
+    """
+
+    def setUp(self):
+        if db is None:
+            raise unittest.SkipTest('psycopg2 is not installed')
+        try:
+            db.clean_tables()
+        except psycopg2.OperationalError:
+            raise unittest.SkipTest('Postgres is not available')
+
+    def _breakConnection(self, **kwargs):
+        pconn = db.pool.get()
+        pconn.conn = _BrokenConnection(pconn.conn, **kwargs)
+        db.pool.put(pconn)
+
+    def _insertPath(self):
+        return db.fetch_prepared('insert_paths', 1, 1, 2, 1, [1])
+
+    def _countPaths(self):
+        return db.fetch('SELECT count(*) FROM path_table')[0][0]
+
+    def testRetryBeforeCommit(self):
+        self._breakConnection(fail_cursor=True)
+        self._insertPath()
+        eq_(self._countPaths(), 1)
+
+    def testFailedCommit(self):
+        self._breakConnection(fail_commit=True)
+        self.assertRaises(psycopg2.OperationalError, self._insertPath)
+        #The commit went through, running it again would add a path
+        eq_(self._countPaths(), 1)
+
+class Test_memory_entry(Test_entry):
+    """ Test case for cloudyswitch.entry on the in-memory backend
+    """
+
+    def setUp(self):
+        self.storage = MemoryBackend()
+
+    def _addHosts(self, *hosts):
+        for host in hosts:
+            self.storage.hosts.add(host)
+
+class Test_journal_entry(Test_entry):
+    """ Test case for cloudyswitch.entry on the write-behind backend
+    """
+
+    def setUp(self):
+        super(Test_journal_entry, self).setUp()
+        self.storage = JournalBackend()
+
+    def tearDown(self):
+        self.storage.close()
+
+    def _addHosts(self, *hosts):
+        for host in hosts:
+            self.storage.hosts.add(host)
+            self.storage.journal.put('insert_host', *host)
+
+    def _registerRoute(self):
+        src_port = test_util.createPort(4, 3)
+        dst_port = test_util.createPort(5, 3)
+        paths = self._createPaths(src_port, dst_port)
+        src_port_arp_table = (4, 3, '62:1e:dd:aa:41:9e', '10.0.0.2')
+        dst_port_arp_table = (5, 3, '96:06:4d:e3:70:50', '10.0.0.3')
+        self._addHosts(src_port_arp_table, dst_port_arp_table)
+        path_ids = self.storage.handle_paths(paths, src_port_arp_table,
+                                             dst_port_arp_table)
+        self.storage.fetch_group_flows((path_ids[0][0], path_ids[1][0]))
+        return paths, src_port_arp_table, dst_port_arp_table, path_ids
+
+    def _checkPersisted(self):
+        """The tables hold what was decided in memory."""
+        postgres = db.PostgresBackend()
+        postgres.restore()
+        for dpid in (1, 4, 5):
+            eq_(postgres.fetch_switch_state(dpid),
+                self.storage.fetch_switch_state(dpid))
+
+    def testRestore(self):
+        paths, src_port_arp_table, dst_port_arp_table, path_ids = \
+            self._registerRoute()
+        self.storage.journal.flush()
+        self._checkPersisted()
+        restored = JournalBackend()
+        restored.restore()
+        for dpid in (1, 4, 5):
+            eq_(restored.fetch_switch_state(dpid),
+                self.storage.fetch_switch_state(dpid))
+        eq_(restored.failover.ports_down([(1, 4)]),
+            self.storage.failover.ports_down([(1, 4)]))
+        eq_(restored.handle_paths(paths, src_port_arp_table,
+                                  dst_port_arp_table), path_ids)
+        #New ids continue after the restored ones
+        restored.handle_paths(paths, dst_port_arp_table, src_port_arp_table)
+        eq_(sorted(restored.paths)[-1], len(paths) * 2)
+        restored.close()
+
+    def testWriteFailure(self):
+        journal = self.storage.journal
+        journal.RETRY_DELAY = 0
+        write = journal.write
+        failures = []
+        def _write(entries):
+            #The db goes away once, then refuses the bogus entry.
+            if not failures:
+                failures.append(entries)
+                raise psycopg2.OperationalError('connection lost')
+            if ('bogus', ()) in entries:
+                failures.append(entries)
+                raise psycopg2.ProgrammingError('unknown statement')
+            write(entries)
+        journal.write = _write
+        self._addHosts((1, 1, '00:00:00:00:00:01', '10.0.0.1'))
+        journal.put('bogus')
+        self._registerRoute()
+        journal.flush()
+        eq_(len(journal), 0)
+        #Split down to the bogus entry, which is retried and dropped
+        eq_(len(failures[-1]), 1)
+        eq_(failures[-journal.RETRIES:], [[('bogus', ())]] * journal.RETRIES)
+        self._checkPersisted()
+        eq_(len(db.fetch('SELECT * FROM arp_table')), 3)
+
+    def testCloseUnreachable(self):
+        def _write(entries):
+            raise psycopg2.OperationalError('could not connect to server')
+        journal = Journal(_write)
+        journal.RETRY_DELAY = .01
+        journal.CLOSE_TIMEOUT = .1
+        journal.put('insert_host', 1, 1, '00:00:00:00:00:01', '10.0.0.1')
+        eq_(journal.flush(.05), False)
+        start = time.time()
+        journal.close()
+        eq_(time.time() - start < 1, True)
+        eq_(journal.thread.dead, True)
+        eq_(len(journal), 1)
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 cloudysunny14.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+from nose.tools import eq_
+
+from ryu.ofproto import ofproto_v1_3
+from ryu.ofproto import ofproto_v1_3_parser
+from app.flow_batch import BarrierTracker
+from app.flow_mirror import FlowMirror
+import test_util
+
+LOG = logging.getLogger(__name__)
+
+class Test_flow_batch(unittest.TestCase):
+    """ Test case for cloudyswitch.flow_batch
+    """
+
+    def setUp(self):
+        self.tracker = BarrierTracker()
+        self.completed = []
+
+    def tearDown(self):
+        pass
+
+    def _sendEcho(self, datapath):
+        datapath.send_msg(datapath.ofproto_parser.OFPEchoRequest(datapath))
+
+    def _sendFlow(self, datapath, out_port):
+        parser = ofproto_v1_3_parser
+        match = parser.OFPMatch(eth_type=0x0800, ip_dscp=8)
+        insts = [parser.OFPInstructionActions(
+                 ofproto_v1_3.OFPIT_APPLY_ACTIONS,
+                 [parser.OFPActionOutput(out_port)])]
+        datapath.send_msg(parser.OFPFlowMod(
+            datapath, 0, 0, 0, ofproto_v1_3.OFPFC_ADD, 0, 0, 100,
+            ofproto_v1_3.OFPCML_NO_BUFFER, ofproto_v1_3.OFPP_ANY,
+            ofproto_v1_3.OFPG_ANY, 0, match, insts))
+
+    def _flowMods(self, datapath):
+        return [msg_type for msg_type, xid in datapath.sentMsgs()
+                if msg_type == ofproto_v1_3.OFPT_FLOW_MOD]
+
+    def testMirror(self):
+        tracker = BarrierTracker(FlowMirror())
+        datapath = test_util.FakeDatapath(1)
+        #A discarded transaction is not taken as installed.
+        transaction = tracker.transaction()
+        self._sendFlow(transaction.datapath(datapath), 1)
+        transaction.discard()
+        transaction.commit()
+        eq_([], datapath.sent)
+        transaction = tracker.transaction()
+        self._sendFlow(transaction.datapath(datapath), 1)
+        eq_(1, len(transaction))
+        transaction.commit()
+        eq_(1, len(self._flowMods(datapath)))
+        transaction = tracker.transaction()
+        batch = transaction.datapath(datapath)
+        self._sendFlow(batch, 1)
+        eq_(0, len(transaction))
+        #The flow is replaced and put back within the batch.
+        self._sendFlow(batch, 2)
+        self._sendFlow(batch, 1)
+        eq_(2, len(transaction))
+
+    def testCommit(self):
+        first = test_util.FakeDatapath(1)
+        second = test_util.FakeDatapath(2)
+        transaction = self.tracker.transaction(self.completed.append)
+        for i in range(3):
+            self._sendEcho(transaction.datapath(first))
+        self._sendEcho(transaction.datapath(second))
+        eq_([], first.sent)
+        eq_(4, len(transaction))
+        transaction.commit()
+        #Messages and the barrier go out in a single write.
+        eq_(1, len(first.sent))
+        msgs = first.sentMsgs()
+        eq_([ofproto_v1_3.OFPT_ECHO_REQUEST] * 3 +
+            [ofproto_v1_3.OFPT_BARRIER_REQUEST],
+            [msg_type for msg_type, xid in msgs])
+        eq_(False, self.tracker.barrier_reply(1, msgs[0][1]))
+        eq_(True, self.tracker.barrier_reply(1, msgs[-1][1]))
+        eq_([], self.completed)
+        eq_(True, self.tracker.barrier_reply(2, second.sentMsgs()[-1][1]))
+        eq_([transaction], self.completed)
+        eq_(4, transaction.size)
+        eq_(True, transaction.elapsed >= 0)
+
+    def testExpire(self):
+        datapath = test_util.FakeDatapath(1)
+        transaction = self.tracker.transaction(self.completed.append)
+        self._sendEcho(transaction.datapath(datapath))
+        transaction.commit()
+        eq_(0, self.tracker.expire(transaction.started))
+        eq_(1, self.tracker.expire(transaction.started +
+                                   BarrierTracker.TIMEOUT + 1))
+        eq_([transaction], self.completed)
+        eq_(None, transaction.elapsed)
+        eq_({}, self.tracker.waiting)
+
+    def testEmpty(self):
+        transaction = self.tracker.transaction(self.completed.append)
+        transaction.datapath(test_util.FakeDatapath(1))
+        transaction.commit()
+        eq_([transaction], self.completed)
+        eq_(0, transaction.size)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 cloudysunny14.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+from nose.tools import eq_
+
+from ryu.ofproto import ofproto_v1_3
+from ryu.ofproto import ofproto_v1_3_parser
+from app.flow_mirror import FlowMirror
+import test_util
+
+LOG = logging.getLogger(__name__)
+
+class Test_flow_mirror(unittest.TestCase):
+    """ Test case for cloudyswitch.flow_mirror
+    """
+
+    def setUp(self):
+        self.mirror = FlowMirror()
+        self.datapath = test_util.FakeDatapath(1)
+
+    def tearDown(self):
+        pass
+
+    def _suppress(self, msg):
+        self.datapath.set_xid(msg)
+        msg.serialize()
+        return self.mirror.suppress(self.datapath.id, msg)
+
+    def _flowMod(self, out_port, command=ofproto_v1_3.OFPFC_ADD,
+                 table_id=0):
+        parser = ofproto_v1_3_parser
+        match = parser.OFPMatch(eth_type=0x0800, ip_dscp=8)
+        actions = [parser.OFPActionOutput(out_port)]
+        insts = [parser.OFPInstructionActions(
+                 ofproto_v1_3.OFPIT_APPLY_ACTIONS, actions)]
+        return parser.OFPFlowMod(self.datapath, 0, 0, table_id, command,
+                                 0, 0, 100, ofproto_v1_3.OFPCML_NO_BUFFER,
+                                 ofproto_v1_3.OFPP_ANY, ofproto_v1_3.OFPG_ANY,
+                                 0, match, insts)
+
+    def _groupMod(self, command, watch_port):
+        parser = ofproto_v1_3_parser
+        buckets = [parser.OFPBucket(0, watch_port, ofproto_v1_3.OFPG_ANY,
+                                    [parser.OFPActionOutput(watch_port)])]
+        return parser.OFPGroupMod(self.datapath, command,
+                                  ofproto_v1_3.OFPGT_FF, 1, buckets)
+
+    def testFlowMod(self):
+        eq_(False, self._suppress(self._flowMod(1)))
+        #Only the xid differs.
+        eq_(True, self._suppress(self._flowMod(1)))
+        #Same match and priority, new actions replace the flow.
+        eq_(False, self._suppress(self._flowMod(2)))
+        eq_(True, self._suppress(self._flowMod(2)))
+        eq_(False, self._suppress(self._flowMod(2, table_id=1)))
+        eq_(False, self._suppress(self._flowMod(2,
+                                                ofproto_v1_3.OFPFC_DELETE)))
+        eq_(False, self._suppress(self._flowMod(2)))
+        eq_(True, self._suppress(self._flowMod(2, table_id=1)))
+        eq_((5, 3), (self.mirror.sent, self.mirror.suppressed))
+        eq_(3. / 8, self.mirror.suppression_rate())
+
+    def testGroupMod(self):
+        eq_(False, self._suppress(self._groupMod(ofproto_v1_3.OFPGC_ADD, 1)))
+        eq_(True,
+            self._suppress(self._groupMod(ofproto_v1_3.OFPGC_MODIFY, 1)))
+        eq_(False,
+            self._suppress(self._groupMod(ofproto_v1_3.OFPGC_MODIFY, 2)))
+        self.mirror.reset(self.datapath.id)
+        eq_(False,
+            self._suppress(self._groupMod(ofproto_v1_3.OFPGC_MODIFY, 2)))
+
+    def testOtherMessage(self):
+        for i in range(2):
+            msg = ofproto_v1_3_parser.OFPEchoRequest(self.datapath)
+            eq_(False, self._suppress(msg))
+        eq_(0, self.mirror.sent)
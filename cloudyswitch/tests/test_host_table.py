@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 cloudysunny14.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+from nose.tools import eq_
+
+from app.host_table import HostTable
+
+LOG = logging.getLogger(__name__)
+
+class Test_host_table(unittest.TestCase):
+    """ Test case for cloudyswitch.host_table
+    """
+
+    def setUp(self):
+        self.hosts = HostTable()
+
+    def tearDown(self):
+        pass
+
+    def testLearn(self):
+        entry, is_new = self.hosts.learn(4, 3, '62:1e:dd:aa:41:9e', '10.0.0.2')
+        eq_((4, 3, '62:1e:dd:aa:41:9e', '10.0.0.2'), entry)
+        eq_(True, is_new)
+        #Already learned host keeps its first location.
+        entry, is_new = self.hosts.learn(5, 1, '62:1e:dd:aa:41:9e', '10.0.0.2')
+        eq_((4, 3, '62:1e:dd:aa:41:9e', '10.0.0.2'), entry)
+        eq_(False, is_new)
+        eq_(1, len(self.hosts))
+
+    def testLookup(self):
+        self.hosts.learn(4, 3, '62:1e:dd:aa:41:9e', '10.0.0.2')
+        self.hosts.learn(5, 3, '96:06:4d:e3:70:50', '10.0.0.3')
+        eq_((5, 3, '96:06:4d:e3:70:50', '10.0.0.3'),
+            self.hosts.get_by_ip('10.0.0.3'))
+        eq_((4, 3, '62:1e:dd:aa:41:9e', '10.0.0.2'),
+            self.hosts.get_by_mac('62:1e:dd:aa:41:9e'))
+        eq_(None, self.hosts.get_by_ip('10.0.0.4'))
+        self.hosts.clear()
+        eq_(None, self.hosts.get_by_mac('62:1e:dd:aa:41:9e'))
+
+if __name__ == '__main__':
+    unittest.main()
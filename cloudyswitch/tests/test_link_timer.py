@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 cloudysunny14.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+from nose.tools import eq_
+
+from app.switches_v1_3 import LinkTimer
+
+LOG = logging.getLogger(__name__)
+
+class Test_link_timer(unittest.TestCase):
+    """ Test case for cloudyswitch.switches_v1_3.LinkTimer
+    """
+
+    def testExpired(self):
+        timer = LinkTimer()
+        eq_(timer.next_deadline(), None)
+        eq_(timer.arm('a', 3.), True)
+        eq_(timer.arm('b', 1.), True)
+        eq_(timer.arm('c', 2.), False)
+        eq_(timer.next_deadline(), 1.)
+        eq_(timer.expired(0.5), [])
+        eq_(timer.expired(2.), ['b', 'c'])
+        eq_(len(timer), 1)
+        eq_(timer.expired(10.), ['a'])
+        eq_(timer.next_deadline(), None)
+
+    def testRearm(self):
+        timer = LinkTimer()
+        timer.arm('a', 1.)
+        timer.arm('b', 2.)
+        eq_(timer.arm('a', 5.), False)
+        eq_(timer.next_deadline(), 2.)
+        eq_(timer.expired(3.), ['b'])
+        eq_(timer.arm('a', 5.), False)
+        eq_(timer.arm('a', 0.5), True)
+        eq_(timer.expired(6.), ['a'])
+        eq_(len(timer.heap), 0)
+
+if __name__ == '__main__':
+    unittest.main()
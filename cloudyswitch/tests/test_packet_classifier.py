@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 cloudysunny14.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+from nose.tools import eq_, raises
+
+from ryu.lib.packet import arp
+from ryu.lib.packet import ethernet
+from ryu.lib.packet import packet
+from ryu.ofproto import ether
+from ryu.topology.switches import LLDPPacket
+from app import packet_classifier
+
+LOG = logging.getLogger(__name__)
+
+class Test_packet_classifier(unittest.TestCase):
+    """ Test case for cloudyswitch.packet_classifier
+    """
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def _arpData(self):
+        pkt = packet.Packet()
+        pkt.add_protocol(ethernet.ethernet('ff:ff:ff:ff:ff:ff',
+                                           '62:1e:dd:aa:41:9e',
+                                           ether.ETH_TYPE_ARP))
+        pkt.add_protocol(arp.arp_ip(arp.ARP_REQUEST, '62:1e:dd:aa:41:9e',
+                                    '10.0.0.2', '00:00:00:00:00:00',
+                                    '10.0.0.3'))
+        pkt.serialize()
+        return str(pkt.data)
+
+    def testArp(self):
+        data = self._arpData()
+        eq_(ether.ETH_TYPE_ARP, packet_classifier.ethertype(data))
+        arppkt = packet_classifier.parse_arp(data)
+        eq_(arp.ARP_REQUEST, arppkt.opcode)
+        eq_('62:1e:dd:aa:41:9e', arppkt.src_mac)
+        eq_('10.0.0.2', arppkt.src_ip)
+        eq_('10.0.0.3', arppkt.dst_ip)
+        eq_(None, packet_classifier.parse_arp(data[:30]))
+        eq_(None, packet_classifier.ethertype(data[:10]))
+
+    def testLldp(self):
+        data = str(LLDPPacket.lldp_packet(0x123456789a, 0xfffffff0,
+                                          '62:1e:dd:aa:41:9e', 120))
+        eq_(ether.ETH_TYPE_LLDP, packet_classifier.ethertype(data))
+        eq_(LLDPPacket.lldp_parse(data), packet_classifier.parse_lldp(data))
+        eq_((0x123456789a, 0xfffffff0), packet_classifier.parse_lldp(data))
+
+    @raises(LLDPPacket.LLDPUnknownFormat)
+    def testTruncatedLldp(self):
+        data = str(LLDPPacket.lldp_packet(1, 2, '62:1e:dd:aa:41:9e', 120))
+        packet_classifier.parse_lldp(data[:30])
+
+    @raises(LLDPPacket.LLDPUnknownFormat)
+    def testNotLldp(self):
+        packet_classifier.parse_lldp(self._arpData())
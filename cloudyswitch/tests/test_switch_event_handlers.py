@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 cloudysunny14.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import struct
+import unittest
+import logging
+from nose.tools import eq_
+
+from ryu.lib.packet import arp
+from ryu.lib.packet.ethernet import ethernet
+from ryu.lib.packet.packet import Packet
+from ryu.ofproto import ether
+from ryu.ofproto import ofproto_v1_3
+from ryu.ofproto import ofproto_v1_3_parser
+from ryu.topology.switches import Link, Switch
+from app import event
+from app.switch_event_handlers import SwitchEventHandler
+import test_util
+
+LOG = logging.getLogger(__name__)
+
+class _SwitchEventHandler(SwitchEventHandler):
+    STORAGE_BACKEND = 'memory'
+
+class _Event(object):
+    def __init__(self, msg):
+        self.msg = msg
+
+class Test_switch_event_handlers(unittest.TestCase):
+    """ Test case for cloudyswitch.switch_event_handlers
+    """
+
+    #Table of the flows to the end hosts
+    HOST_TABLE = 7
+
+    def setUp(self):
+        self.handler = _SwitchEventHandler()
+        self.datapaths = {}
+        for dpid in (1, 2):
+            datapath = test_util.FakeDatapath(dpid)
+            switch = Switch(datapath)
+            for port_no in (1, 2):
+                switch.add_port(ofproto_v1_3_parser.OFPPort(
+                    port_no, '00:00:00:00:00:%02x' % port_no, 'p',
+                    0, 0, 0, 0, 0, 0, 0, 0))
+            self.handler.switch_enter_handler(event.EventSwitchEnter(switch))
+            self.datapaths[dpid] = datapath
+        for src, dst in ((1, 2), (2, 1)):
+            self.handler.link_add_handler(event.EventLinkAdd(Link(
+                test_util.createPort(src, 1), test_util.createPort(dst, 1))))
+        self._ackBarriers()
+
+    def tearDown(self):
+        self.handler.close()
+
+    def _ackBarriers(self):
+        for datapath in self.datapaths.values():
+            for msg_type, xid in datapath.sentMsgs():
+                if msg_type == ofproto_v1_3.OFPT_BARRIER_REQUEST:
+                    self.handler.barriers.barrier_reply(datapath.id, xid)
+            datapath.sent = []
+
+    def _arpIn(self, dpid, in_port, src, dst_ip):
+        pkt = Packet()
+        pkt.add_protocol(ethernet('ff:ff:ff:ff:ff:ff', src[0],
+                                  ether.ETH_TYPE_ARP))
+        pkt.add_protocol(arp.arp_ip(arp.ARP_REQUEST, src[0], src[1],
+                                    '00:00:00:00:00:00', dst_ip))
+        pkt.serialize()
+        datapath = self.datapaths[dpid]
+        msg = ofproto_v1_3_parser.OFPPacketIn(
+            datapath, 0xffffffff, len(pkt.data), 0, 0, 0,
+            ofproto_v1_3_parser.OFPMatch(in_port=in_port), bytes(pkt.data))
+        msg.datapath = datapath
+        self.handler.arp_received_handler(
+            event.EventArpReceived(_Event(msg)))
+
+    def _flowMods(self, dpid, table_id=None):
+        """Return the table ids of the flow mods sent to dpid."""
+        table_ids = []
+        for buf in self.datapaths[dpid].sent:
+            offset = 0
+            while offset < len(buf):
+                msg_type, msg_len = struct.unpack_from('!xBH', buf, offset)
+                if msg_type == ofproto_v1_3.OFPT_FLOW_MOD:
+                    table_ids.append(struct.unpack_from('!B', buf,
+                                                        offset + 24)[0])
+                offset += msg_len
+        if table_id is not None:
+            table_ids = [table for table in table_ids if table == table_id]
+        return table_ids
+
+    def testFailedRoute(self):
+        first = ('00:00:00:00:01:01', '10.0.0.1')
+        second = ('00:00:00:00:01:02', '10.0.0.2')
+        self._arpIn(1, 2, first, second[1])
+        process_route = self.handler.process_route
+        def _process_route(src_port, dst_port, transaction):
+            #The switch of the route left after the host flows were queued
+            raise KeyError(dst_port[0])
+        self.handler.process_route = _process_route
+        self.assertRaises(KeyError, self._arpIn, 2, 2, second, first[1])
+        eq_(self._flowMods(1), [])
+        eq_(self._flowMods(2), [])
+        #The host flows were not taken as installed, they go out now.
+        self.handler.process_route = process_route
+        self._arpIn(2, 2, second, first[1])
+        eq_(len(self._flowMods(1, self.HOST_TABLE)), 8)
+        eq_(len(self._flowMods(2, self.HOST_TABLE)), 8)
+
+if __name__ == '__main__':
+    unittest.main()
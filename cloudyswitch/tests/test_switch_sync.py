@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 cloudysunny14.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import struct
+import unittest
+import logging
+from nose.tools import eq_
+
+from ryu.ofproto import ofproto_v1_3
+from ryu.ofproto import ofproto_v1_3_parser
+from app.switch_sync import SwitchSync
+import test_util
+
+LOG = logging.getLogger(__name__)
+
+class _Reply(object):
+    def __init__(self, xid, buf):
+        self.xid = xid
+        self.buf = buf
+
+class Test_switch_sync(unittest.TestCase):
+    """ Test case for cloudyswitch.switch_sync
+    """
+
+    def setUp(self):
+        self.datapath = test_util.FakeDatapath(1)
+
+    def tearDown(self):
+        pass
+
+    def _flow_mod(self, label, port):
+        dp = self.datapath
+        parser = dp.ofproto_parser
+        match = parser.OFPMatch(eth_type=0x8847, mpls_label=label)
+        actions = [parser.OFPActionOutput(port, 0)]
+        inst = [parser.OFPInstructionActions(
+                dp.ofproto.OFPIT_APPLY_ACTIONS, actions)]
+        return self._serialize(parser.OFPFlowMod(
+            dp, 0, 0, 0, dp.ofproto.OFPFC_ADD, 0, 0, 0, 0xffffffff,
+            dp.ofproto.OFPP_ANY, dp.ofproto.OFPG_ANY, 0, match, inst))
+
+    def _group_mod(self, group_id, port):
+        dp = self.datapath
+        parser = dp.ofproto_parser
+        actions = [parser.OFPActionOutput(port, 0)]
+        buckets = [parser.OFPBucket(0, port, dp.ofproto.OFPG_ANY, actions)]
+        return self._serialize(parser.OFPGroupMod(
+            dp, dp.ofproto.OFPGC_ADD, dp.ofproto.OFPGT_FF, group_id, buckets))
+
+    def _serialize(self, msg):
+        self.datapath.set_xid(msg)
+        msg.serialize()
+        return msg
+
+    def _reply(self, xid, stats_type, entries):
+        body = ''.join(entries)
+        buf = struct.pack('!BBHIHHxxxx', ofproto_v1_3.OFP_VERSION,
+                          ofproto_v1_3.OFPT_MULTIPART_REPLY, 16 + len(body),
+                          xid, stats_type, 0) + body
+        return _Reply(xid, buf)
+
+    def _flow_entry(self, mod):
+        table_id, = struct.unpack_from('!B', mod.buf, 24)
+        priority, = struct.unpack_from('!H', mod.buf, 30)
+        entry = str(mod.buf[48:])
+        return struct.pack('!HBxIIHHHHxxxxQQQ', 48 + len(entry), table_id,
+                           0, 0, priority, 0, 0, 0, 0, 0, 0) + entry
+
+    def _group_entry(self, mod):
+        buckets = str(mod.buf[16:])
+        return struct.pack('!HBxI', 8 + len(buckets), mod.type,
+                           mod.group_id) + buckets
+
+    def testDiff(self):
+        ofp = ofproto_v1_3
+        flows = [self._flow_mod(label, 1) for label in (1, 2, 3)]
+        groups = [self._group_mod(1, 1), self._group_mod(2, 2)]
+        sync = SwitchSync(self.datapath, flows + groups)
+        flow_xid, group_xid, meter_xid = [request.xid for request
+                                          in sync.requests()]
+        #Flow 2 goes out of port 2, flow 3 and group 2 are missing.
+        installed_flows = [flows[0], self._flow_mod(2, 2)]
+        installed_groups = [groups[0], self._group_mod(3, 1)]
+        eq_(sync.stats_reply(self._reply(
+            flow_xid, ofp.OFPMP_FLOW,
+            [self._flow_entry(mod) for mod in installed_flows])), False)
+        eq_(sync.stats_reply(self._reply(
+            group_xid, ofp.OFPMP_GROUP_DESC,
+            [self._group_entry(mod) for mod in installed_groups])), False)
+        eq_(sync.stats_reply(self._reply(
+            meter_xid, ofp.OFPMP_METER_CONFIG, [])), True)
+        mods, installed = sync.diff()
+        eq_(installed, [flows[0], groups[0]])
+        eq_(mods[:3], [flows[1], flows[2], groups[1]])
+        eq_(groups[1].command, ofp.OFPGC_ADD)
+        #The group which is not expected any more
+        eq_(len(mods), 4)
+        eq_((mods[3].command, mods[3].group_id), (ofp.OFPGC_DELETE, 3))
+
+    def testModifyGroup(self):
+        ofp = ofproto_v1_3
+        group = self._group_mod(1, 1)
+        sync = SwitchSync(self.datapath, [group])
+        flow_xid, group_xid, meter_xid = [request.xid for request
+                                          in sync.requests()]
+        sync.stats_reply(self._reply(flow_xid, ofp.OFPMP_FLOW, []))
+        sync.stats_reply(self._reply(meter_xid, ofp.OFPMP_METER_CONFIG, []))
+        eq_(sync.stats_reply(self._reply(
+            group_xid, ofp.OFPMP_GROUP_DESC,
+            [self._group_entry(self._group_mod(1, 2))])), True)
+        mods, installed = sync.diff()
+        eq_(mods, [group])
+        eq_(group.command, ofp.OFPGC_MODIFY)
+        eq_(struct.unpack_from('!H', group.buf, 8)[0], ofp.OFPGC_MODIFY)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 cloudysunny14.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import unittest
+import logging
+from nose.tools import eq_, ok_
+
+from ryu.lib import hub
+from ryu.ofproto import ofproto_v1_3_parser
+from ryu.topology.switches import LLDPPacket
+from app import event
+from app.switches_v1_3 import L2Switch
+import test_util
+
+LOG = logging.getLogger(__name__)
+
+class _L2Switch(L2Switch):
+    LLDP_SEND_PERIOD_PER_PORT = .05
+    LLDP_RATE_PER_SWITCH = 1000.
+
+    def __init__(self, *args, **kwargs):
+        super(_L2Switch, self).__init__(*args, **kwargs)
+        self.events = []
+
+    def send_event_to_observers(self, ev, state=None):
+        self.events.append(ev)
+
+class _Event(object):
+    def __init__(self, msg):
+        self.msg = msg
+
+class Test_switches(unittest.TestCase):
+    """ Test case for cloudyswitch.switches_v1_3.L2Switch
+    """
+
+    def setUp(self):
+        self.switches = None
+
+    def tearDown(self):
+        if self.switches is not None:
+            self.switches.close()
+
+    def _createSwitches(self, cls, port_nos):
+        self.switches = cls()
+        self.datapaths = {}
+        for dpid in (1, 2):
+            datapath = test_util.FakeDatapath(dpid)
+            for port_no in port_nos:
+                datapath.ports[port_no] = self._ofpPort(port_no)
+            self.switches._register(datapath)
+            for port_no in port_nos:
+                self.switches._port_added(
+                    self.switches._get_port(dpid, port_no))
+            self.datapaths[dpid] = datapath
+        self.switches.lldp_event.set()
+
+    def _ofpPort(self, port_no, state=0):
+        return ofproto_v1_3_parser.OFPPort(
+            port_no, '00:00:00:00:00:%02x' % port_no, 'p', 0, state,
+            0, 0, 0, 0, 0, 0)
+
+    def _portStatus(self, dpid, reason, ofpport):
+        datapath = self.datapaths[dpid]
+        msg = ofproto_v1_3_parser.OFPPortStatus(datapath, reason, ofpport)
+        msg.datapath = datapath
+        self.switches.port_status_handler(_Event(msg))
+
+    def _events(self, cls):
+        return [ev for ev in self.switches.events if isinstance(ev, cls)]
+
+    def _lldpIn(self, src_dpid, src_port_no, dst_dpid, in_port):
+        datapath = self.datapaths[dst_dpid]
+        data = str(LLDPPacket.lldp_packet(src_dpid, src_port_no,
+                                          '00:00:00:00:00:01', 120))
+        msg = ofproto_v1_3_parser.OFPPacketIn(
+            datapath, 0xffffffff, len(data), 0, 0, 0,
+            ofproto_v1_3_parser.OFPMatch(in_port=in_port), data)
+        msg.datapath = datapath
+        self.switches._packet_in_handler(_Event(msg))
+
+    def _answerLldp(self, seconds):
+        end = time.time() + seconds
+        while time.time() < end:
+            self._lldpIn(1, 1, 2, 1)
+            self._lldpIn(2, 1, 1, 1)
+            hub.sleep(.01)
+
+    def _waitLinkDelete(self, seconds):
+        """Return the seconds until the first EventLinkDelete, or None."""
+        start = time.time()
+        while time.time() - start < seconds:
+            if self._events(event.EventLinkDelete):
+                return time.time() - start
+            hub.sleep(.005)
+        return None
+
+    def testLinkDown(self):
+        self._createSwitches(_L2Switch, [1])
+        switches = self.switches
+        self._answerLldp(.2)
+        eq_(len(switches.links), 2)
+        period = switches.LLDP_SEND_PERIOD_PER_PORT
+        elapsed = self._waitLinkDelete(1.)
+        #The last frame came back just now and the next one is missed
+        ok_(elapsed is not None)
+        ok_(switches.LINK_LLDP_MISSES * period <= elapsed <
+            (switches.LINK_LLDP_MISSES + 2) * period, elapsed)
+
+    def testPacedLinkDown(self):
+        class _PacedL2Switch(_L2Switch):
+            LLDP_RATE_PER_SWITCH = 20.
+        #Four ports per switch are sent every .2s instead of every .05s
+        self._createSwitches(_PacedL2Switch, [1, 2, 3, 4])
+        switches = self.switches
+        self._answerLldp(.5)
+        interval = switches._lldp_interval(test_util.createPort(1, 1))
+        ok_(interval > .15, interval)
+        elapsed = self._waitLinkDelete(2.)
+        ok_(elapsed is not None)
+        ok_(switches.LINK_LLDP_MISSES * interval <= elapsed <
+            (switches.LINK_LLDP_MISSES + 2) * interval, (elapsed, interval))
+
+    def testPortStatus(self):
+        self._createSwitches(_L2Switch, [1])
+        switches = self.switches
+        ofp = self.datapaths[1].ofproto
+        self._lldpIn(1, 1, 2, 1)
+        self._lldpIn(2, 1, 1, 1)
+        eq_(len(switches.links), 2)
+        self._portStatus(1, ofp.OFPPR_ADD, self._ofpPort(2))
+        port = switches._get_port(1, 2)
+        eq_((port.dpid, port.port_no), (1, 2))
+        ok_(port in switches.ports)
+        eq_([ev.port for ev in self._events(event.EventPortAdd)], [port])
+        self._portStatus(1, ofp.OFPPR_MODIFY,
+                         self._ofpPort(2, ofp.OFPPS_LINK_DOWN))
+        eq_(switches._get_port(1, 2).is_live(), False)
+        eq_(len(self._events(event.EventPortModify)), 1)
+        #The link over the deleted port goes with it.
+        port = switches._get_port(1, 1)
+        self._portStatus(1, ofp.OFPPR_DELETE, self._ofpPort(1))
+        eq_(switches._get_port(1, 1), None)
+        ok_(port not in switches.ports)
+        eq_(len(self._events(event.EventPortDelete)), 1)
+        eq_([(ev.link.src, ev.link.dst) for ev
+             in self._events(event.EventLinkDelete)],
+            [(port, switches._get_port(2, 1)),
+             (switches._get_port(2, 1), port)])
+        eq_(len(switches.links), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -23,7 +23,8 @@ from ryu.ofproto import ofproto_v1_3_parser
 from ryu.ofproto import ofproto_v1_3
 from ryu.topology.switches import Port, Link
 
-from app.topology_util import PathList 
+from app.topology_util import LinkedPorts, PathCache, PathList, TopologyGraph
+from app.route_precompute import all_pairs_paths
 
 LOG = logging.getLogger(__name__)
 
@@ -92,5 +93,104 @@ class Test_topology_util(unittest.TestCase):
                 eq_(expected_path[port_index][0], path[port_index].dpid)
                 eq_(expected_path[port_index][1], path[port_index].port_no)
 
+    def testBoundedPaths(self):
+        links = [(3, 1, 1, 2), (2, 4, 5, 2), (2, 3, 4, 2), (5, 2, 2, 4),\
+                 (1, 4, 5, 1), (2, 2, 3, 2), (3, 2, 2, 2), (1, 2, 3, 1),\
+                 (1, 3, 4, 1), (4, 1, 1, 3), (4, 2, 2, 3), (1, 1, 2, 1),\
+                 (5, 1, 1, 4), (2, 1, 1, 1)]
+        path_list = PathList(self._getLinkList(links))
+        paths = path_list.createWholePath(4, 5, k=3)
+        eq_([[(4, 1), (1, 3), (1, 4), (5, 1)],
+             [(4, 2), (2, 3), (2, 4), (5, 2)],
+             [(4, 1), (1, 3), (1, 1), (2, 1), (2, 4), (5, 2)]],
+            [[(port.dpid, port.port_no) for port in path] for path in paths])
+        paths = path_list.createWholePath(4, 5, max_hops=3)
+        eq_(4, len(paths))
+        paths = path_list.createWholePath(4, 5, max_hops=1)
+        eq_([], paths)
+
+    def testTopologyGraph(self):
+        topology = TopologyGraph()
+        links = self._getLinkList([(4, 1, 1, 3), (1, 4, 5, 1), (4, 2, 2, 3),
+                                   (2, 4, 5, 2)])
+        for link in links:
+            topology.addLink(link)
+        eq_(4, topology.version)
+        #Already known link is not added twice.
+        eq_(False, topology.addLink(self._createLink(4, 1, 1, 3)))
+        path_list = PathList(topology)
+        eq_(2, len(path_list.createWholePath(4, 5)))
+        eq_(True, topology.delLink(self._createLink(1, 4, 5, 1)))
+        eq_(5, topology.version)
+        paths = path_list.createWholePath(4, 5)
+        eq_([[(4, 2), (2, 3), (2, 4), (5, 2)]],
+            [[(port.dpid, port.port_no) for port in path] for path in paths])
+
+    def testPathCache(self):
+        links = self._getLinkList([(4, 1, 1, 3), (1, 4, 5, 1), (4, 2, 2, 3),
+                                   (2, 4, 5, 2), (2, 1, 1, 1)])
+        path_list = PathList(links)
+        cache = PathCache(size=2)
+        eq_(None, cache.get(4, 5))
+        cache.put(4, 5, path_list.createWholePath(4, 5))
+        cache.put(2, 1, path_list.createWholePath(2, 1))
+        eq_(3, len(cache.get(4, 5)))
+        eq_((1, 1), (cache.hits, cache.misses))
+        #Only the routes through the deleted link are dropped.
+        eq_(1, cache.invalidate_link(links[1]))
+        eq_(None, cache.get(4, 5))
+        eq_(1, len(cache.get(2, 1)))
+        #The least recently used pair is evicted.
+        cache.put(1, 5, path_list.createWholePath(1, 5))
+        cache.put(2, 5, path_list.createWholePath(2, 5))
+        eq_(None, cache.get(2, 1))
+        eq_((2, 3), (cache.hits, cache.misses))
+        eq_(2, len(cache))
+
+    def testAllPairsPaths(self):
+        graph = {1: [2, 3], 2: [1, 3], 3: [1, 2]}
+        routes = all_pairs_paths(graph, [1, 3], k=2)
+        eq_([(1, 2, [[1, 2], [1, 3, 2]]), (1, 3, [[1, 3], [1, 2, 3]]),
+             (3, 1, [[3, 1], [3, 2, 1]]), (3, 2, [[3, 2], [3, 1, 2]])],
+            routes)
+
+    def testPrecomputedPaths(self):
+        topology = TopologyGraph()
+        links = [(1, 1, 2, 1), (1, 3, 3, 1), (1, 2, 2, 2), (2, 3, 4, 1),
+                 (3, 2, 4, 2)]
+        links += [(dst_dpid, dst_port, src_dpid, src_port)
+                  for src_dpid, src_port, dst_dpid, dst_port in links]
+        for link in self._getLinkList(links):
+            topology.addLink(link)
+        topology.delLink(self._createLink(1, 1, 2, 1))
+        path_list = PathList(topology)
+        graph = topology.compact().adjacency()
+        for k in (1, None):
+            for src_dpid, dst_dpid, paths in all_pairs_paths(graph,
+                                                             sorted(graph), k):
+                eq_([[port.dpid for port in path][::2] + [dst_dpid]
+                     for path in path_list.createWholePath(src_dpid,
+                                                           dst_dpid, k)],
+                    paths)
+        eq_([[1, 2, 4]], all_pairs_paths(graph, [1], k=1)[2][2])
+
+    def testLinkedPorts(self):
+        linked_ports = LinkedPorts()
+        first, second, other = self._getLinkList([(1, 1, 2, 1), (1, 2, 2, 2),
+                                                  (1, 3, 3, 1)])
+        for link in (first, second, other):
+            linked_ports.addLink(link)
+        eq_(first, linked_ports.getLink(1, 2))
+        eq_([first, second], linked_ports.getLinks(1, 2))
+        eq_(None, linked_ports.getLink(2, 1))
+        eq_(None, linked_ports.getLink(9, 1))
+        #The parallel link takes over.
+        eq_(True, linked_ports.delLink(first))
+        eq_(False, linked_ports.delLink(first))
+        eq_(second, linked_ports.getLink(1, 2))
+        eq_(True, linked_ports.delLink(second))
+        eq_(False, linked_ports.hasLink(second))
+        eq_(other, linked_ports.getLink(1, 3))
+
 if __name__ == '__main__':
     unittest.main()
@@ -15,6 +15,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from ryu.ofproto import ofproto_parser
 from ryu.ofproto import ofproto_v1_3_parser
 from ryu.ofproto import ofproto_v1_3
 from ryu.topology.switches import Port, Link
@@ -48,3 +49,40 @@ def getLinkList(links):
         link = createLink(src_dpid, src_port, dst_dpid, dst_port)
         link_list.append(link)
     return link_list
+
+class FakeDatapath(object):
+    """Datapath which keeps the buffers it was asked to send."""
+
+    def __init__(self, dpid):
+        self.id = dpid
+        self.ofproto = ofproto_v1_3
+        self.ofproto_parser = ofproto_v1_3_parser
+        self.xid = 0
+        self.sent = []
+        self.ports = {}     # port_no => OFPPort
+
+    def set_xid(self, msg):
+        self.xid += 1
+        msg.set_xid(self.xid)
+        return self.xid
+
+    def send_msg(self, msg):
+        if msg.xid is None:
+            self.set_xid(msg)
+        msg.serialize()
+        self.send(msg.buf)
+
+    def send(self, buf):
+        self.sent.append(buf)
+
+    def sentMsgs(self):
+        """Return (msg_type, xid) of every message sent."""
+        msgs = []
+        for buf in self.sent:
+            offset = 0
+            while offset < len(buf):
+                (version, msg_type, msg_len, xid) = \
+                    ofproto_parser.header(buf[offset:])
+                msgs.append((msg_type, xid))
+                offset += msg_len
+        return msgs